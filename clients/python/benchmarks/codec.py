@@ -0,0 +1,104 @@
+"""
+Benchmarks for encoding messages with each of the available codecs (and for decoding
+them, which always uses the standard library).
+
+Run with `poetry run python benchmarks/codec.py` (optionally specifying case names to
+filter by). Install `orjson` and/or `msgspec` to include them.
+"""
+
+import random
+import sys
+import time
+import typing as t
+
+from coflux import codec, models, serialisation
+
+_REPEAT = 5
+_MESSAGES = 10_000
+
+
+def _value(data: t.Any) -> tuple:
+    return ("raw", models.Encoded(serialisation._json_dumps(data)), [])
+
+
+def _heartbeat(i: int) -> dict[str, t.Any]:
+    return {"request": "record_heartbeats", "params": [{str(i): 1}]}
+
+
+def _log_message(i: int) -> dict[str, t.Any]:
+    return {
+        "request": "log_messages",
+        "params": [
+            [
+                f"{i}",
+                int(time.time() * 1000),
+                2,
+                "Processed {count} items ({rate} per second)",
+                {"count": _value(i), "rate": _value(random.random())},
+            ]
+        ],
+    }
+
+
+def _submit(i: int) -> dict[str, t.Any]:
+    arguments = [_value({"id": i, "tags": ["a", "b"]}), _value(list(range(20)))]
+    return {
+        "request": "submit",
+        "params": [
+            "example.repo",
+            "process",
+            "task",
+            arguments,
+            f"{i}",
+            [],
+            {"params": True, "max_age": None, "namespace": None, "version": None},
+            None,
+            None,
+            None,
+            None,
+            None,
+        ],
+        "id": i,
+    }
+
+
+def _execute(i: int) -> list[t.Any]:
+    # (received from the server)
+    arguments = [["raw", {"type": "dict", "items": ["id", i, "score", 0.5]}, []]]
+    return [1, {"command": "execute", "params": [f"{i}", "repo", "task", arguments]}]
+
+
+CASES: dict[str, t.Callable[[int], t.Any]] = {
+    "heartbeat": _heartbeat,
+    "log_message": _log_message,
+    "submit": _submit,
+    "execute": _execute,
+}
+
+
+def _measure(fn: t.Callable[[], t.Any]) -> float:
+    timings = []
+    for _ in range(_REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(filters: list[str]) -> None:
+    random.seed(0)
+    print(f"{'case':<16}{'codec':<10}{'encode (msg/s)':>16}")
+    for name, create in CASES.items():
+        if filters and not any(f in name for f in filters):
+            continue
+        messages = [create(i) for i in range(_MESSAGES)]
+        for codec_ in codec.available():
+            encode_time = _measure(lambda: [codec_.dumps(m) for m in messages])
+            print(f"{name:<16}{codec_.name:<10}{_MESSAGES / encode_time:>16,.0f}")
+        encoded = [codec.dumps(m) for m in messages]
+        decode_time = _measure(lambda: [codec.loads(e) for e in encoded])
+        print(f"{name:<16}{'(decode)':<10}{_MESSAGES / decode_time:>16,.0f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,123 @@
+"""
+Benchmarks for the Pandas serialiser's formats and compression options.
+
+Run with `poetry run python benchmarks/pandas_formats.py` (requires the `pandas`
+extra). For each frame and configuration, reports the encoding time, decoding time and
+encoded size.
+"""
+
+import sys
+import tempfile
+import time
+import typing as t
+
+import numpy
+import pandas
+
+from coflux import blobs, serialisation
+
+_REPEAT = 3
+
+CONFIGS: dict[str, dict[str, t.Any]] = {
+    "parquet": {"format": "parquet", "compression": None},
+    "parquet-none": {"format": "parquet", "compression": "none"},
+    "parquet-zstd": {"format": "parquet", "compression": "zstd"},
+    "parquet-zstd-9": {
+        "format": "parquet",
+        "compression": "zstd",
+        "compression_level": 9,
+    },
+    "feather": {"format": "feather", "compression": None},
+    "feather-none": {"format": "feather", "compression": "none"},
+    "feather-zstd": {"format": "feather", "compression": "zstd"},
+}
+
+
+def _numeric(rows: int) -> pandas.DataFrame:
+    generator = numpy.random.default_rng(0)
+    return pandas.DataFrame(
+        {
+            **{f"float_{i}": generator.random(rows) for i in range(4)},
+            **{f"int_{i}": generator.integers(0, 1000, rows) for i in range(4)},
+        }
+    )
+
+
+def _mixed(rows: int) -> pandas.DataFrame:
+    generator = numpy.random.default_rng(0)
+    return pandas.DataFrame(
+        {
+            "id": numpy.arange(rows),
+            "name": [f"name-{i}" for i in generator.integers(0, 10_000, rows)],
+            "category": pandas.Categorical(
+                generator.choice(["a", "b", "c", "d"], rows)
+            ),
+            "value": generator.random(rows),
+            "flag": generator.random(rows) > 0.5,
+        }
+    )
+
+
+def _timeseries(rows: int) -> pandas.DataFrame:
+    generator = numpy.random.default_rng(0)
+    index = pandas.date_range("2024-01-01", periods=rows, freq="s", name="time")
+    return pandas.DataFrame(
+        {"price": generator.random(rows).cumsum(), "volume": generator.random(rows)},
+        index=index,
+    )
+
+
+FRAMES: dict[str, t.Callable[[], t.Any]] = {
+    "numeric-1m": lambda: _numeric(1_000_000),
+    "mixed-200k": lambda: _mixed(200_000),
+    "timeseries-1m": lambda: _timeseries(1_000_000),
+    "series-1m": lambda: _numeric(1_000_000)["float_0"],
+}
+
+
+def _measure(fn: t.Callable[[], t.Any]) -> tuple[float, t.Any]:
+    timings = []
+    result = None
+    for _ in range(_REPEAT):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main(filters: list[str]) -> None:
+    print(
+        f"{'frame':<16}{'config':<16}"
+        f"{'encode (s)':>12}{'decode (s)':>12}{'size (MB)':>12}"
+    )
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # (blobs are read from a local cache)
+        blob_manager = blobs.Manager([], "localhost", temp_dir)
+        for frame_name, create in FRAMES.items():
+            if filters and not any(f in frame_name for f in filters):
+                continue
+            value = create()
+            for config_name, options in CONFIGS.items():
+                serialiser = serialisation.PandasSerialiser(
+                    lazy=False,
+                    format=options["format"],
+                    compression=options["compression"],
+                    compression_level=options.get("compression_level"),
+                    index=None,
+                    provenance=False,
+                )
+                encode_time, result = _measure(lambda: serialiser.serialise(value))
+                format, buffer, metadata = result
+                blob = blobs.InlineBlob(blob_manager, buffer.getvalue())
+                decode_time, _ = _measure(
+                    lambda: serialiser.deserialise(format, blob, metadata)
+                )
+                size = blob.size / 1_000_000
+                print(
+                    f"{frame_name:<16}{config_name:<16}"
+                    f"{encode_time:>12.3f}{decode_time:>12.3f}{size:>12.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
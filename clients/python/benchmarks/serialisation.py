@@ -0,0 +1,106 @@
+"""
+Benchmarks for serialising/deserialising values.
+
+Run with `poetry run python benchmarks/serialisation.py` (optionally specifying case
+names to filter by). Values are serialised with a blob threshold that's large enough for data to
+remain inline, so that blob storage isn't included in timings.
+"""
+
+import random
+import sys
+import time
+import typing as t
+
+from coflux import blobs, serialisation
+
+_REPEAT = 5
+
+
+def _ints(n: int) -> list[int]:
+    return list(range(n))
+
+
+def _floats(n: int) -> list[float]:
+    return [random.random() for _ in range(n)]
+
+
+def _records(n: int) -> list[dict[str, t.Any]]:
+    return [
+        {"id": i, "name": f"item-{i}", "score": random.random(), "tags": ["a", "b"]}
+        for i in range(n)
+    ]
+
+
+def _matrix(n: int) -> list[list[float]]:
+    return [_floats(n) for _ in range(n)]
+
+
+def _tree(depth: int, width: int) -> t.Any:
+    if depth == 0:
+        return {"value": random.random()}
+    return {f"child-{i}": _tree(depth - 1, width) for i in range(width)}
+
+
+def _mixed(n: int) -> list[t.Any]:
+    return [
+        ({i, i + 1}, (i, str(i)), {(i, i): [i, None, True]}, [[i]]) for i in range(n)
+    ]
+
+
+def _nested(depth: int) -> list[t.Any]:
+    root: list[t.Any] = []
+    current = root
+    for _ in range(depth):
+        current.append([])
+        current = current[0]
+    return root
+
+
+CASES: dict[str, t.Callable[[], t.Any]] = {
+    "ints-1m": lambda: _ints(1_000_000),
+    "floats-1m": lambda: _floats(1_000_000),
+    "records-100k": lambda: _records(100_000),
+    "records-1m": lambda: _records(1_000_000),
+    "matrix-1k": lambda: _matrix(1_000),
+    "tree-6x6": lambda: _tree(6, 6),
+    "mixed-100k": lambda: _mixed(100_000),
+    "nested-10k": lambda: _nested(10_000),
+}
+
+
+def _measure(fn: t.Callable[[], t.Any]) -> float:
+    timings = []
+    for _ in range(_REPEAT):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def _unsupported(*args) -> t.NoReturn:
+    raise Exception("references aren't supported")
+
+
+def main(filters: list[str]) -> None:
+    random.seed(0)
+    # the nested case exceeds the default limit when encoding/decoding the JSON
+    sys.setrecursionlimit(100_000)
+    blob_manager = blobs.Manager([], "localhost")
+    manager = serialisation.Manager([], sys.maxsize, blob_manager)
+    print(f"{'case':<16}{'serialise (s)':>16}{'deserialise (s)':>18}")
+    for name, create in CASES.items():
+        if filters and not any(f in name for f in filters):
+            continue
+        value = create()
+        serialised = manager.serialise(value)
+        serialise_time = _measure(lambda: manager.serialise(value))
+        deserialise_time = _measure(
+            lambda: manager.deserialise(
+                serialised, _unsupported, _unsupported, _unsupported
+            )
+        )
+        print(f"{name:<16}{serialise_time:>16.3f}{deserialise_time:>18.3f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
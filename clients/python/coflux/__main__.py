@@ -167,6 +167,11 @@ def _init(
     serialiser_configs: list[config.SerialiserConfig],
     blob_threshold: int,
     blob_store_configs: list[config.BlobStoreConfig],
+    blob_cache_dir: str | None,
+    blob_cache_size: int,
+    server_format: t.Literal["json", "msgpack"],
+    server_compression: bool,
+    queue_config: config.QueueConfig | None,
     concurrency: int,
     launch_id: str | None,
     register: bool,
@@ -184,6 +189,11 @@ def _init(
             serialiser_configs,
             blob_threshold,
             blob_store_configs,
+            blob_cache_dir,
+            blob_cache_size,
+            server_format,
+            server_compression,
+            queue_config,
             concurrency,
             launch_id,
             targets,
@@ -808,6 +818,11 @@ def agent(
         "serialiser_configs": config and config.serialisers,
         "blob_threshold": config and config.blobs and config.blobs.threshold,
         "blob_store_configs": config and config.blobs and config.blobs.stores,
+        "blob_cache_dir": config and config.blobs and config.blobs.cache_dir,
+        "blob_cache_size": config and config.blobs and config.blobs.cache_size,
+        "server_format": config and config.server and config.server.format,
+        "server_compression": config and config.server and config.server.compression,
+        "queue_config": config and config.server and config.server.queue,
         "concurrency": concurrency,
         "launch_id": launch,
         "register": register or dev,
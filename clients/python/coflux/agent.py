@@ -9,30 +9,9 @@ import websockets
 from . import config, execution, models, server
 
 
-def _parse_reference(reference: t.Any) -> models.Reference:
-    match reference:
-        case ["execution", execution_id]:
-            return ("execution", execution_id)
-        case ["asset", asset_id]:
-            return ("asset", asset_id)
-        case ["fragment", serialiser, blob_key, size, metadata]:
-            return ("fragment", serialiser, blob_key, size, metadata)
-        case other:
-            raise Exception(f"unexpected reference: {other}")
-
-
-def _parse_references(references: list[t.Any]) -> list[models.Reference]:
-    return [_parse_reference(r) for r in references]
-
-
-# TODO: remove duplication in execution.py
-def _parse_value(value: list) -> models.Value:
-    match value:
-        case ["raw", content, references]:
-            return ("raw", content, _parse_references(references))
-        case ["blob", key, size, references]:
-            return ("blob", key, size, _parse_references(references))
-    raise Exception(f"unexpected value: {value}")
+# how often to report queue stats (if messages were delayed by more than the threshold)
+_QUEUE_STATS_INTERVAL_S = 60
+_QUEUE_WAIT_THRESHOLD_S = 1
 
 
 def _encode_tags(provides: dict[str, list[str]]) -> str:
@@ -49,6 +28,11 @@ class Agent:
         serialiser_configs: list[config.SerialiserConfig],
         blob_threshold: int,
         blob_store_configs: list[config.BlobStoreConfig],
+        blob_cache_dir: str | None,
+        blob_cache_size: int,
+        server_format: t.Literal["json", "msgpack"],
+        server_compression: bool,
+        queue_config: config.QueueConfig | None,
         concurrency: int,
         launch_id: str | None,
         targets: dict[str, dict[str, tuple[models.Target, t.Callable]]],
@@ -57,14 +41,22 @@ class Agent:
         self._environment_name = environment_name
         self._launch_id = launch_id
         self._server_host = server_host
+        self._server_compression = server_compression
         self._provides = provides
         self._concurrency = concurrency
         self._targets = targets
         self._connection = server.Connection(
-            {"execute": self._handle_execute, "abort": self._handle_abort}
+            {"execute": self._handle_execute, "abort": self._handle_abort},
+            server_format,
+            queue_config,
         )
         self._execution_manager = execution.Manager(
-            self._connection, serialiser_configs, blob_threshold, blob_store_configs
+            self._connection,
+            serialiser_configs,
+            blob_threshold,
+            blob_store_configs,
+            blob_cache_dir,
+            blob_cache_size,
         )
 
     def __enter__(self):
@@ -77,7 +69,7 @@ class Agent:
         (execution_id, repository, target_name, arguments) = args
         print(f"Handling execute '{target_name}' ({execution_id})...")
         target = self._targets[repository][target_name][1].__name__
-        arguments = [_parse_value(a) for a in arguments]
+        arguments = [models.parse_value(a) for a in arguments]
         loop = asyncio.get_running_loop()
         self._execution_manager.execute(
             execution_id, repository, target, arguments, self._server_host, loop
@@ -89,6 +81,22 @@ class Agent:
         if not self._execution_manager.abort(execution_id):
             print(f"Ignored abort for unrecognised execution ({execution_id}).")
 
+    async def _report_queue_stats(self) -> t.NoReturn:
+        while True:
+            await asyncio.sleep(_QUEUE_STATS_INTERVAL_S)
+            stats = self._connection.queue_stats()
+            if any(s.max_wait > _QUEUE_WAIT_THRESHOLD_S for s in stats.values()):
+                summary = "; ".join(
+                    f"{lane}: {s.sent} sent, {s.mean_wait:.1f}s mean wait, "
+                    f"{s.max_wait:.1f}s max wait"
+                    for lane, s in stats.items()
+                    if s.sent
+                )
+                print(f"Messages were delayed ({summary}).")
+            dropped = self._connection.take_dropped()
+            if dropped:
+                print(f"Dropped {dropped} log message(s) (queue full).")
+
     def _url(self, scheme: str, path: str, params: dict[str, str]) -> str:
         params_ = {k: v for k, v in params.items() if v is not None} if params else None
         query_string = f"?{urllib.parse.urlencode(params_)}" if params_ else ""
@@ -107,6 +115,8 @@ class Agent:
             params["provides"] = _encode_tags(self._provides)
         if self._concurrency:
             params["concurrency"] = str(self._concurrency)
+        if self._connection.format != "json":
+            params["format"] = self._connection.format
         return params
 
     async def run(self) -> None:
@@ -116,7 +126,9 @@ class Agent:
             )
             url = self._url("ws", "agent", self._params())
             try:
-                async with websockets.connect(url) as websocket:
+                async with websockets.connect(
+                    url, compression="deflate" if self._server_compression else None
+                ) as websocket:
                     print("Connected.")
                     targets: dict[str, dict[models.TargetType, list[str]]] = {}
                     for repository, repository_targets in self._targets.items():
@@ -127,6 +139,7 @@ class Agent:
                     coros = [
                         asyncio.create_task(self._connection.run(websocket)),
                         asyncio.create_task(self._execution_manager.run(targets)),
+                        asyncio.create_task(self._report_queue_stats()),
                     ]
                     done, pending = await asyncio.wait(
                         coros, return_when=asyncio.FIRST_COMPLETED
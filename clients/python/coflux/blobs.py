@@ -3,6 +3,17 @@ import hashlib
 import typing as t
 import io
 import abc
+import bisect
+import concurrent.futures
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
 from pathlib import Path
 
 from . import config
@@ -14,6 +25,35 @@ except ImportError:
     boto3 = None
     botocore = None
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_PARALLELISM = 8
+
+# from linux/fs.h
+_FICLONE = 0x40049409
+
+_CHUNK_MIN_SIZE = 256 * 1024
+_CHUNK_MAX_SIZE = 8 * 1024 * 1024
+
+# Chunk boundaries are placed at the end of a run of bytes that all map to one in this
+# (arbitrary, but fixed) table. The length of the run determines the average chunk size:
+# 119 of the 256 bytes map to one, so (for random data) a run of 17 is expected every
+# ~800KB, which, after the minimum size, gives an average of ~1MB. Because boundaries
+# only depend on nearby content, an insertion or removal only affects the chunks around
+# it.
+_CHUNK_TABLE = bytes(
+    (b >> i) & 1 for b in hashlib.sha256(b"coflux").digest() for i in range(8)
+)
+_CHUNK_ANCHOR = b"\x01" * 17
+
+# when the host cache exceeds its size limit, the least recently used blobs are removed
+# until it's below this fraction of the limit (so that eviction isn't needed for every
+# subsequent blob)
+_CACHE_LOW_WATERMARK = 0.9
+
 
 def _hash_file(buffer: t.BinaryIO):
     buffer.seek(0)
@@ -23,6 +63,83 @@ def _hash_file(buffer: t.BinaryIO):
     return hash.hexdigest()
 
 
+def _find_boundary(data: bytes | bytearray) -> int | None:
+    start = _CHUNK_MIN_SIZE - len(_CHUNK_ANCHOR)
+    index = data[start:_CHUNK_MAX_SIZE].translate(_CHUNK_TABLE).find(_CHUNK_ANCHOR)
+    return start + index + len(_CHUNK_ANCHOR) if index >= 0 else None
+
+
+def _reflink(source: Path, target: Path) -> bool:
+    if not fcntl or not sys.platform.startswith("linux"):
+        return False
+    with source.open("rb") as source_file, target.open("wb") as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), _FICLONE, source_file.fileno())
+            return True
+        except OSError:
+            pass
+    target.unlink()
+    return False
+
+
+def _materialise(source: Path, target: Path, mode: int | None, link: bool) -> None:
+    # a reflink (i.e., a copy-on-write clone) is preferred, when supported by the file
+    # system. otherwise, the file is copied, unless a hardlink to the cached file is
+    # requested, in which case the target shares the cached file's (read-only) mode,
+    # and mustn't be modified (e.g., by root), since that would modify the cache. an
+    # existing file is removed first, rather than written to, since it may be a
+    # hardlink to the cache (from an earlier restore)
+    mode = mode if mode is not None else 0o644
+    target.unlink(missing_ok=True)
+    if _reflink(source, target):
+        target.chmod(mode)
+        return
+    if link:
+        try:
+            os.link(source, target)
+            return
+        except OSError:
+            pass
+    shutil.copyfile(source, target)
+    target.chmod(mode)
+
+
+def _default_cache_dir() -> Path:
+    return Path(tempfile.gettempdir()).joinpath("coflux", "cache")
+
+
+def _locks_dir() -> Path:
+    return Path(tempfile.gettempdir()).joinpath("coflux", "locks")
+
+
+@contextlib.contextmanager
+def _lock(key: str):
+    # host-wide (i.e., across execution processes), so that concurrent puts of the
+    # same blob wait for the first upload, and then find that the blob exists
+    if not fcntl:
+        yield
+        return
+    path = _locks_dir().joinpath(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    while True:
+        with path.open("a") as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            # the lock file is removed (while locked) when the lock is released, so if
+            # the file was removed (or replaced) while waiting, the lock is retried
+            try:
+                current = path.stat().st_ino
+            except FileNotFoundError:
+                current = None
+            if current != os.fstat(file.fileno()).st_ino:
+                continue
+            try:
+                yield
+            finally:
+                path.unlink(missing_ok=True)
+                fcntl.flock(file, fcntl.LOCK_UN)
+            return
+
+
 class Store(abc.ABC):
     @abc.abstractmethod
     def __enter__(self):
@@ -37,25 +154,43 @@ class Store(abc.ABC):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def put(self, buffer: t.BinaryIO) -> str:
+    def get_range(self, key: str, start: int, end: int) -> bytes | None:
         raise NotImplementedError
 
     @abc.abstractmethod
-    def download(self, key: str, path: Path) -> bool:
+    def put(self, buffer: t.BinaryIO, key: str | None = None) -> str:
         raise NotImplementedError
 
     @abc.abstractmethod
-    def upload(self, path: Path) -> str:
+    def download(self, key: str, path: Path) -> bool:
         raise NotImplementedError
 
 
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
 class HttpStore(Store):
-    def __init__(self, protocol: t.Literal["http", "https"], host: str):
+    def __init__(
+        self,
+        protocol: t.Literal["http", "https"],
+        host: str,
+        timeout: float,
+        chunk_size: int,
+        parallelism: int,
+        retries: int,
+    ):
         self._protocol = protocol
         self._host = host
+        self._timeout = timeout
+        self._chunk_size = chunk_size
+        self._parallelism = parallelism
+        self._retries = retries
 
     def __enter__(self):
-        self._client = httpx.Client(timeout=10)
+        self._client = httpx.Client(timeout=self._timeout)
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
@@ -64,6 +199,21 @@ class HttpStore(Store):
     def _url(self, key: str) -> str:
         return f"{self._protocol}://{self._host}/blobs/{key}"
 
+    def _parts_url(self, key: str, index: int | None = None) -> str:
+        suffix = f"/{index}" if index is not None else ""
+        return f"{self._url(key)}/parts{suffix}"
+
+    def _with_retries(self, fn: t.Callable[[], httpx.Response]) -> httpx.Response:
+        attempt = 0
+        while True:
+            try:
+                return fn().raise_for_status()
+            except Exception as e:
+                if attempt >= self._retries or not _is_retryable(e):
+                    raise
+                time.sleep(min(2**attempt, 30) * (0.5 + random.random()))
+                attempt += 1
+
     def _exists(self, key: str) -> bool:
         return self._client.head(self._url(key)).status_code == 200
 
@@ -74,14 +224,64 @@ class HttpStore(Store):
         response.raise_for_status()
         return io.BytesIO(response.content)
 
-    def put(self, buffer: t.BinaryIO) -> str:
+    def get_range(self, key: str, start: int, end: int) -> bytes | None:
+        headers = {"Range": f"bytes={start}-{end - 1}"}
+        response = self._client.get(self._url(key), headers=headers)
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        if response.status_code == 206:
+            return response.content
+        # range not supported by server
+        return response.content[start:end]
+
+    def put(self, buffer: t.BinaryIO, key: str | None = None) -> str:
         assert buffer.seekable()
-        key = _hash_file(buffer)
+        key = key or _hash_file(buffer)
         if not self._exists(key):
-            buffer.seek(0)
-            self._client.put(self._url(key), content=buffer).raise_for_status()
+            size = buffer.seek(0, io.SEEK_END)
+            if size > self._chunk_size:
+                self._put_parts(key, buffer, size)
+            else:
+                buffer.seek(0)
+                content = buffer.read()
+                self._with_retries(
+                    lambda: self._client.put(self._url(key), content=content)
+                )
         return key
 
+    def _put_parts(self, key: str, buffer: t.BinaryIO, size: int) -> None:
+        # parts already received by the server (e.g., from an interrupted attempt) are
+        # skipped, so that the upload is resumed
+        response = self._with_retries(lambda: self._client.get(self._parts_url(key)))
+        existing = response.json()["parts"]
+        count = (size + self._chunk_size - 1) // self._chunk_size
+        lock = threading.Lock()
+
+        def _put_part(index: int) -> None:
+            offset = index * self._chunk_size
+            length = min(self._chunk_size, size - offset)
+            if existing.get(str(index)) == length:
+                return
+            with lock:
+                buffer.seek(offset)
+                content = buffer.read(length)
+            self._with_retries(
+                lambda: self._client.put(self._parts_url(key, index), content=content)
+            )
+
+        with concurrent.futures.ThreadPoolExecutor(self._parallelism) as executor:
+            list(executor.map(_put_part, range(count)))
+        # the server assembles (and hashes) the blob before responding, which can take
+        # a while for large blobs, so the response is waited for without a timeout
+        self._with_retries(
+            lambda: self._client.post(
+                self._parts_url(key),
+                json={"count": count},
+                timeout=httpx.Timeout(self._timeout, read=None),
+            )
+        )
+
     def download(self, key: str, path: Path) -> bool:
         with self._client.stream("GET", self._url(key)) as response:
             if response.status_code == 404:
@@ -92,10 +292,6 @@ class HttpStore(Store):
                     file.write(chunk)
                 return True
 
-    def upload(self, path: Path) -> str:
-        with open(path, "rb") as file:
-            return self.put(file)
-
 
 class S3Store(Store):
     def __init__(self, bucket_name: str, prefix: str | None, region: str | None):
@@ -135,9 +331,21 @@ class S3Store(Store):
         except botocore.exceptions.NoSuchKey:
             return None
 
-    def put(self, buffer: t.BinaryIO) -> str:
+    def get_range(self, key: str, start: int, end: int) -> bytes | None:
+        assert botocore
+        try:
+            response = self._s3.get_object(
+                Bucket=self._bucket_name,
+                Key=self._key(key),
+                Range=f"bytes={start}-{end - 1}",
+            )
+            return response["Body"].read()
+        except botocore.exceptions.NoSuchKey:
+            return None
+
+    def put(self, buffer: t.BinaryIO, key: str | None = None) -> str:
         assert buffer.seekable()
-        key = _hash_file(buffer)
+        key = key or _hash_file(buffer)
         if not self._exists(key):
             buffer.seek(0)
             self._s3.put_object(
@@ -156,23 +364,195 @@ class S3Store(Store):
         except botocore.exceptions.NoSuchKey:
             return False
 
-    def upload(self, path: Path) -> str:
-        with open(path, "rb") as file:
-            return self.put(file)
-
 
 def _create(config_: config.BlobStoreConfig, server_host: str):
     if config_.type == "http":
-        return HttpStore(config_.protocol, config_.host or server_host)
+        return HttpStore(
+            config_.protocol,
+            config_.host or server_host,
+            config_.timeout,
+            config_.chunk_size,
+            config_.parallelism,
+            config_.retries,
+        )
     elif config_.type == "s3":
         return S3Store(config_.bucket, config_.prefix, config_.region)
     else:
         raise ValueError("unrecognised blob store config")
 
 
+class _Reader(io.RawIOBase):
+    def __init__(self, size: int):
+        self._size = size
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self._size + offset
+        else:
+            raise ValueError(f"unrecognised whence ({whence})")
+        return self._position
+
+    def readinto(self, buffer) -> int:
+        end = min(self._position + len(buffer), self._size)
+        if end <= self._position:
+            return 0
+        data = self._read(self._position, end)
+        buffer[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    @abc.abstractmethod
+    def _read(self, start: int, end: int) -> bytes:
+        raise NotImplementedError
+
+
+class _RangeReader(_Reader):
+    def __init__(self, manager: "Manager", key: str, size: int):
+        super().__init__(size)
+        self._manager = manager
+        self._key = key
+
+    def _read(self, start: int, end: int) -> bytes:
+        return self._manager.get_range(self._key, start, end)
+
+
+class _ChunkedReader(_Reader):
+    def __init__(self, manager: "Manager", chunks: list[tuple[str, int]]):
+        self._offsets = [0]
+        for _, size in chunks:
+            self._offsets.append(self._offsets[-1] + size)
+        super().__init__(self._offsets[-1])
+        self._manager = manager
+        self._chunks = chunks
+
+    def _read(self, start: int, end: int) -> bytes:
+        # reads (at most) up to the end of the chunk containing `start`, fetching the
+        # chunk into the cache if necessary
+        index = bisect.bisect_right(self._offsets, start) - 1
+        key, _ = self._chunks[index]
+        with self._manager._cached(key).open("rb") as file:
+            file.seek(start - self._offsets[index])
+            return file.read(min(end, self._offsets[index + 1]) - start)
+
+
+class ChunkedWriter(io.RawIOBase):
+    def __init__(self, manager: "Manager", parallelism: int = 4):
+        self._manager = manager
+        self._parallelism = parallelism
+        self._executor = concurrent.futures.ThreadPoolExecutor(parallelism)
+        self._buffer = bytearray()
+        self._chunks: list[concurrent.futures.Future[list]] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= _CHUNK_MAX_SIZE:
+            self._cut(_find_boundary(self._buffer) or _CHUNK_MAX_SIZE)
+        return len(data)
+
+    def _cut(self, boundary: int) -> None:
+        chunk = bytes(self._buffer[:boundary])
+        del self._buffer[:boundary]
+        # limit the number of chunks held in memory while waiting to be uploaded
+        pending = [f for f in self._chunks if not f.done()]
+        if len(pending) >= self._parallelism:
+            concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+        self._chunks.append(self._executor.submit(self._put_chunk, chunk))
+
+    def _put_chunk(self, chunk: bytes) -> list:
+        return [self._manager.put(io.BytesIO(chunk)), len(chunk)]
+
+    def finish(self) -> str:
+        while self._buffer:
+            self._cut(
+                _find_boundary(self._buffer) or min(len(self._buffer), _CHUNK_MAX_SIZE)
+            )
+        chunks = [f.result() for f in self._chunks]
+        manifest = json.dumps({"chunks": chunks}, separators=(",", ":")).encode()
+        return self._manager.put(io.BytesIO(manifest))
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+        super().close()
+
+
+class Blob:
+    def __init__(self, manager: "Manager", key: str, size: int):
+        self._manager = manager
+        self._key = key
+        self._size = size
+
+    @property
+    def key(self) -> str:
+        return self._key
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def load(self) -> io.BytesIO:
+        return self._manager.get(self._key)
+
+    def path(self) -> Path:
+        # the (read-only) path of the blob in the host cache, after fetching it
+        return self._manager._cached(self._key)
+
+    def open(self, buffer_size: int = 64 * 1024) -> t.BinaryIO:
+        # reads (only) the parts of the blob that are accessed, using ranged requests
+        reader = _RangeReader(self._manager, self._key, self._size)
+        return io.BufferedReader(reader, buffer_size)
+
+
+class InlineBlob(Blob):
+    # a blob whose content is already available (i.e., that was inlined in a value),
+    # so doesn't need to be fetched from a store
+    def __init__(self, manager: "Manager", content: bytes):
+        super().__init__(manager, hashlib.sha256(content).hexdigest(), len(content))
+        self._content = content
+
+    def load(self) -> io.BytesIO:
+        return io.BytesIO(self._content)
+
+    def path(self) -> Path:
+        return self._manager._cached(self._key, self._content)
+
+    def open(self, buffer_size: int = 64 * 1024) -> t.BinaryIO:
+        return io.BytesIO(self._content)
+
+
 class Manager:
-    def __init__(self, store_configs: list[config.BlobStoreConfig], server_host: str):
+    def __init__(
+        self,
+        store_configs: list[config.BlobStoreConfig],
+        server_host: str,
+        cache_dir: str | None = None,
+        cache_size: int | None = None,
+    ):
         self._stores = [_create(c, server_host) for c in store_configs]
+        self._cache_dir = Path(cache_dir) if cache_dir else _default_cache_dir()
+        self._cache_size = cache_size
+        # the (estimated) size of the host cache, which is shared with other processes,
+        # so is recalculated when evicting
+        self._cache_usage: int | None = None
+        self._cache_lock = threading.Lock()
 
     def __enter__(self):
         # TODO: ?
@@ -190,8 +570,17 @@ class Manager:
                 return result
         raise Exception(f"blob not found ({key})")
 
+    def get_range(self, key: str, start: int, end: int) -> bytes:
+        for store in self._stores:
+            result = store.get_range(key, start, end)
+            if result is not None:
+                return result
+        raise Exception(f"blob not found ({key})")
+
     def put(self, buffer: t.BinaryIO) -> str:
-        return self._stores[0].put(buffer)
+        key = _hash_file(buffer)
+        with _lock(key):
+            return self._stores[0].put(buffer, key)
 
     def download(self, key: str, path: Path) -> None:
         for store in self._stores:
@@ -200,4 +589,86 @@ class Manager:
         raise Exception(f"blob not found ({key})")
 
     def upload(self, path: Path) -> str:
-        return self._stores[0].upload(path)
+        with open(path, "rb") as file:
+            return self.put(file)
+
+    def upload_many(self, paths: list[Path]) -> list[str]:
+        with concurrent.futures.ThreadPoolExecutor(_PARALLELISM) as executor:
+            return list(executor.map(self.upload, paths))
+
+    def restore(
+        self, key: str, path: Path, mode: int | None = None, link: bool = False
+    ) -> None:
+        # like `download`, but via the host cache
+        _materialise(self._cached(key), path, mode, link)
+
+    def restore_many(
+        self, items: list[tuple[str, Path, int | None]], link: bool = False
+    ) -> None:
+        with concurrent.futures.ThreadPoolExecutor(_PARALLELISM) as executor:
+            list(executor.map(lambda item: self.restore(*item, link=link), items))
+
+    def chunked_writer(self) -> ChunkedWriter:
+        # splits written data into chunks, which are uploaded (in the background) as
+        # they're completed; `finish` returns the key of the manifest
+        return ChunkedWriter(self)
+
+    def open_chunked(self, key: str, buffer_size: int = 1024 * 1024) -> t.BinaryIO:
+        # chunks are fetched (into the cache) as they're read
+        manifest = json.load(self.get(key))
+        reader = _ChunkedReader(self, manifest["chunks"])
+        return io.BufferedReader(reader, buffer_size)
+
+    def _cached(self, key: str, content: bytes | None = None) -> Path:
+        path = self._cache_dir.joinpath("blobs", key[0:2], key[2:4], key[4:])
+        if not path.exists():
+            with _lock(key):
+                if not path.exists():
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    temp_path = path.with_suffix(".tmp")
+                    if content is not None:
+                        temp_path.write_bytes(content)
+                    else:
+                        self.download(key, temp_path)
+                    temp_path.chmod(0o444)
+                    os.replace(temp_path, path)
+                    self._track_cached(path)
+                    return path
+        # the modification time records when the blob was last used (for eviction)
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return path
+
+    def _track_cached(self, path: Path) -> None:
+        with self._cache_lock:
+            if self._cache_size is None:
+                return
+            if self._cache_usage is not None:
+                self._cache_usage += path.stat().st_size
+                if self._cache_usage <= self._cache_size:
+                    return
+            self._evict(path)
+
+    def _evict(self, keep: Path) -> None:
+        # removes the least recently used blobs until the cache is within its limit. a
+        # removed blob remains readable by any process that has it open (or mapped)
+        assert self._cache_size is not None
+        with _lock("cache"):
+            entries = []
+            for path in self._cache_dir.joinpath("blobs").glob("*/*/*"):
+                if path.suffix == ".tmp" or path == keep:
+                    continue
+                try:
+                    stat_ = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat_.st_mtime, stat_.st_size, path))
+            usage = keep.stat().st_size + sum(size for _, size, _ in entries)
+            if usage > self._cache_size:
+                target = self._cache_size * _CACHE_LOW_WATERMARK
+                for _, size, path in sorted(entries):
+                    if usage <= target:
+                        break
+                    path.unlink(missing_ok=True)
+                    usage -= size
+            self._cache_usage = usage
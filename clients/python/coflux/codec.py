@@ -0,0 +1,133 @@
+import abc
+import json
+import re
+import secrets
+import typing as t
+
+from . import models
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# pre-encoded data is substituted into the encoded message in place of (unguessable)
+# placeholders
+_PLACEHOLDER = f"__encoded_{secrets.token_hex(8)}_"
+_PLACEHOLDER_PATTERN = re.compile(f'"{_PLACEHOLDER}(\\d+)"')
+
+
+class Codec(abc.ABC):
+    name: str
+
+    def dumps(self, data: t.Any) -> str:
+        encoded: list[str] = []
+
+        def _default(obj: t.Any) -> str:
+            if isinstance(obj, models.Encoded):
+                encoded.append(obj.json)
+                return f"{_PLACEHOLDER}{len(encoded) - 1}"
+            raise TypeError(
+                f"Object of type {type(obj).__name__} is not JSON serializable"
+            )
+
+        message = self._dumps(data, _default)
+        if not encoded:
+            return message
+        return _PLACEHOLDER_PATTERN.sub(lambda m: encoded[int(m.group(1))], message)
+
+    @abc.abstractmethod
+    def _dumps(self, data: t.Any, default: t.Callable[[t.Any], t.Any]) -> str:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    name = "json"
+
+    def _dumps(self, data: t.Any, default: t.Callable[[t.Any], t.Any]) -> str:
+        return json.dumps(data, default=default)
+
+
+class OrjsonCodec(Codec):
+    name = "orjson"
+
+    def _dumps(self, data: t.Any, default: t.Callable[[t.Any], t.Any]) -> str:
+        assert orjson
+        return orjson.dumps(data, default=default).decode()
+
+
+class MsgspecCodec(Codec):
+    name = "msgspec"
+
+    def _dumps(self, data: t.Any, default: t.Callable[[t.Any], t.Any]) -> str:
+        assert msgspec
+        return msgspec.json.encode(data, enc_hook=default).decode()
+
+
+def available() -> list[Codec]:
+    codecs: list[Codec] = []
+    if orjson:
+        codecs.append(OrjsonCodec())
+    if msgspec:
+        codecs.append(MsgspecCodec())
+    codecs.append(JsonCodec())
+    return codecs
+
+
+# the fastest available codec, which is used for encoding messages. values are
+# encoded with the standard library, since the encoding determines cache keys and
+# blob keys (and the other codecs format floats and non-ASCII characters
+# differently). decoding also uses the standard library, since the other codecs
+# decode integers that don't fit in 64 bits as floats, and don't support non-finite
+# floats (and checking for these costs as much as is saved)
+default = available()[0]
+
+
+def dumps(data: t.Any) -> str:
+    return default.dumps(data)
+
+
+def loads(data: str | bytes) -> t.Any:
+    return json.loads(data)
+
+
+def join(messages: list[str]) -> str:
+    # combines (encoded) messages into an (encoded) array
+    return f"[{','.join(messages)}]"
+
+
+# (MessagePack) extension type for pre-encoded (JSON) data
+_ENCODED_EXT_TYPE = 1
+
+
+def _pack_default(obj: t.Any) -> t.Any:
+    assert msgpack
+    if isinstance(obj, models.Encoded):
+        return msgpack.ExtType(_ENCODED_EXT_TYPE, obj.json.encode())
+    raise TypeError(f"Object of type {type(obj).__name__} can't be packed")
+
+
+def pack(data: t.Any) -> bytes:
+    assert msgpack
+    # (the stubs allow for None, which is only returned when autoreset is disabled)
+    return t.cast(bytes, msgpack.packb(data, default=_pack_default))
+
+
+def join_packed(messages: list[bytes]) -> bytes:
+    assert msgpack
+    return msgpack.Packer().pack_array_header(len(messages)) + b"".join(messages)
+
+
+def unpack(data: bytes) -> t.Any:
+    assert msgpack
+    return msgpack.unpackb(data)
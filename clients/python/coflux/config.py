@@ -4,14 +4,28 @@ import typing as t
 import pydantic
 
 
+class QueueConfig(pydantic.BaseModel):
+    max_messages: int = 10_000
+    max_bytes: int = 64 * 1024 * 1024
+    spill_dir: str | None = None
+    max_spill_bytes: int = 1024 * 1024 * 1024
+
+
 class ServerConfig(pydantic.BaseModel):
     host: str = "localhost:7777"
+    format: t.Literal["json", "msgpack"] = "json"
+    compression: bool = False
+    queue: QueueConfig = pydantic.Field(default_factory=QueueConfig)
 
 
 class HTTPBlobStoreConfig(pydantic.BaseModel):
     type: t.Literal["http"] = "http"
     protocol: t.Literal["http", "https"] = "http"
     host: str | None = None
+    timeout: float = 10
+    chunk_size: int = 16 * 1024 * 1024
+    parallelism: int = 4
+    retries: int = 5
 
 
 class S3BlobStoreConfig(pydantic.BaseModel):
@@ -34,22 +48,54 @@ def _default_blob_stores():
 class BlobsConfig(pydantic.BaseModel):
     threshold: int = 200
     stores: list[BlobStoreConfig] = pydantic.Field(default_factory=_default_blob_stores)
+    cache_dir: str | None = None
+    cache_size: int = 10 * 1024 * 1024 * 1024
 
 
 class PandasSerialiserConfig(pydantic.BaseModel):
     type: t.Literal["pandas"] = "pandas"
+    lazy: bool = False
+    format: t.Literal["parquet", "feather"] = "parquet"
+    compression: (
+        t.Literal["none", "snappy", "gzip", "brotli", "lz4", "zstd"] | None
+    ) = None
+    compression_level: int | None = None
+    index: bool | None = None
+    provenance: bool = False
+    cache_size: int = 0
+
+
+class NumpySerialiserConfig(pydantic.BaseModel):
+    type: t.Literal["numpy"] = "numpy"
+    mmap: bool = False
+    cache_size: int = 0
+
+
+class ArrowSerialiserConfig(pydantic.BaseModel):
+    type: t.Literal["arrow"] = "arrow"
+    compression: t.Literal["lz4", "zstd"] | None = None
+    cache_size: int = 0
 
 
 class PydanticSerialiserConfig(pydantic.BaseModel):
     type: t.Literal["pydantic"] = "pydantic"
+    provenance: bool = False
+    cache_size: int = 0
 
 
 class PickleSerialiserConfig(pydantic.BaseModel):
     type: t.Literal["pickle"] = "pickle"
+    buffer_threshold: int = 1024 * 1024
+    provenance: bool = False
+    cache_size: int = 0
 
 
 SerialiserConfig = t.Annotated[
-    PandasSerialiserConfig | PydanticSerialiserConfig | PickleSerialiserConfig,
+    PandasSerialiserConfig
+    | NumpySerialiserConfig
+    | ArrowSerialiserConfig
+    | PydanticSerialiserConfig
+    | PickleSerialiserConfig,
     pydantic.Field(discriminator="type"),
 ]
 
@@ -61,6 +107,8 @@ def _default_concurrency():
 def _default_serialisers():
     return [
         PandasSerialiserConfig(),
+        NumpySerialiserConfig(),
+        ArrowSerialiserConfig(),
         PydanticSerialiserConfig(),
         PickleSerialiserConfig(),
     ]
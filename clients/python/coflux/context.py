@@ -56,9 +56,16 @@ def suspend(delay: float | dt.datetime | None = None):
 
 
 def persist_asset(
-    path: Path | str | None = None, *, match: str | None = None
+    path: Path | str | None = None,
+    *,
+    match: str | None = None,
+    archive: bool = False,
+    compress: bool = False,
+    background: bool = False,
 ) -> models.Asset:
-    return _get_channel().persist_asset(path, match=match)
+    return _get_channel().persist_asset(
+        path, match=match, archive=archive, compress=compress, background=background
+    )
 
 
 def checkpoint(*arguments: t.Any) -> None:
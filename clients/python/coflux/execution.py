@@ -1,13 +1,19 @@
 import asyncio
+import collections
+import concurrent.futures
 import contextlib
 import datetime as dt
 import enum
+import io
 import itertools
+import json
 import mimetypes
 import multiprocessing
 import multiprocessing.connection
 import os
+import shutil
 import signal
+import stat
 import sys
 import tempfile
 import threading
@@ -17,12 +23,14 @@ import typing as t
 import zipfile
 from contextlib import contextmanager
 from contextvars import ContextVar
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 
 from . import blobs, config, decorators, loader, models, serialisation, server
 
 _EXECUTION_THRESHOLD_S = 1.0
 _AGENT_THRESHOLD_S = 5.0
+_BACKGROUND_PARALLELISM = 2
+_ASSET_CACHE_SIZE = 1000
 
 
 T = t.TypeVar("T")
@@ -201,6 +209,33 @@ def working_directory():
         os.chdir(original)
 
 
+def _walk_files(path: Path, match: str | None) -> list[Path]:
+    # sorted, to keep the manifest/archive stable between runs
+    paths = []
+    for root, dirs, files in os.walk(path):
+        root = Path(root)
+        dirs.sort()
+        for file in sorted(files):
+            file_path = root.joinpath(file)
+            if not match or file_path.match(match):
+                paths.append(file_path)
+    return paths
+
+
+def _write_zip_entry(zip: zipfile.ZipFile, path: Path, arcname: Path) -> None:
+    # fixed timestamp, so that the archive only changes when file contents do (which
+    # means that unchanged content can be deduplicated when the archive is chunked)
+    info = zipfile.ZipInfo.from_file(path, arcname)
+    info.date_time = (1980, 1, 1, 0, 0, 0)
+    info.compress_type = zip.compression
+    with path.open("rb") as source, zip.open(info, "w") as target:
+        shutil.copyfileobj(source, target)
+
+
+def _zip_members(zip: zipfile.ZipFile, match: str | None) -> list[str]:
+    return [n for n in zip.namelist() if not match or PurePosixPath(n).match(match)]
+
+
 def counter():
     count = itertools.count()
     return lambda: next(count)
@@ -213,6 +248,8 @@ class Channel:
         serialiser_configs: list[config.SerialiserConfig],
         blob_threshold: int,
         blob_store_configs: list[config.BlobStoreConfig],
+        blob_cache_dir: str | None,
+        blob_cache_size: int,
         server_host: str,
         connection,
     ):
@@ -220,10 +257,18 @@ class Channel:
         self._connection = connection
         self._request_id = counter()
         self._requests: dict[int, Future[t.Any]] = {}
+        self._requests_lock = threading.Lock()
         self._cache: dict[t.Any, Future[t.Any]] = {}
         self._running = True
+        self._send_lock = threading.Lock()
+        self._background_executor = concurrent.futures.ThreadPoolExecutor(
+            _BACKGROUND_PARALLELISM
+        )
+        self._pending_assets: list[concurrent.futures.Future[int]] = []
         self._exit_stack = contextlib.ExitStack()
-        self._blob_manager = blobs.Manager(blob_store_configs, server_host)
+        self._blob_manager = blobs.Manager(
+            blob_store_configs, server_host, blob_cache_dir, blob_cache_size
+        )
         self._serialisation_manager = serialisation.Manager(
             serialiser_configs, blob_threshold, self._blob_manager
         )
@@ -234,6 +279,11 @@ class Channel:
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        # background uploads (which may be reading from the working directory) are
+        # cancelled, or waited for (stopping the channel fails any requests they're
+        # waiting on), before the working directory is removed
+        self._stop()
+        self._background_executor.shutdown(cancel_futures=True)
         self._exit_stack.close()
 
     def run(self):
@@ -242,21 +292,40 @@ class Channel:
                 message = self._connection.recv()
                 match message:
                     case ("success_result", (request_id, result)):
-                        self._requests.pop(request_id).set_success(result)
+                        self._pop_request(request_id).set_success(result)
                     case ("error_result", (request_id, error)):
-                        self._requests.pop(request_id).set_error(error)
+                        self._pop_request(request_id).set_error(error)
                     case other:
                         raise Exception(f"Received unhandled response: {other}")
+        # responses are no longer received, so outstanding requests are failed
+        with self._requests_lock:
+            requests = list(self._requests.values())
+            self._requests.clear()
+        for future in requests:
+            future.set_error("execution stopped")
+
+    def _stop(self):
+        with self._requests_lock:
+            self._running = False
+
+    def _pop_request(self, request_id: int) -> Future[t.Any]:
+        with self._requests_lock:
+            return self._requests.pop(request_id)
 
     def _send(self, *message):
-        self._connection.send(message)
+        # (requests may be sent from background threads)
+        with self._send_lock:
+            self._connection.send(message)
 
     def _request(self, request, *, key=None, timeout=None):
         if key and key in self._cache:
             return self._cache[key].result(timeout)
         request_id = self._request_id()
         future = Future()
-        self._requests[request_id] = future
+        with self._requests_lock:
+            if not self._running:
+                raise Exception("execution stopped")
+            self._requests[request_id] = future
         if key:
             self._cache[key] = future
         self._send("request", request_id, request)
@@ -266,15 +335,16 @@ class Channel:
         self._send("notify", notification)
 
     def _record_result(self, data: t.Any):
-        value = self._serialisation_manager.serialise(data)
+        # (results aren't used for cache keys, so don't need to be canonical)
+        value = self._serialisation_manager.serialise(data, canonical=False)
         self._notify(RecordResultRequest(value))
         # TODO: wait for confirmation?
-        self._running = False
+        self._stop()
 
     def _record_error(self, exception):
         self._notify(RecordErrorRequest(_serialise_exception(exception)))
         # TODO: wait for confirmation?
-        self._running = False
+        self._stop()
 
     def submit_execution(
         self,
@@ -300,8 +370,10 @@ class Channel:
             )
             execute_after = (execute_after or dt.datetime.now()) + delay
         # TODO: parallelise?
+        fragment_memo: serialisation.Memo = {}
         serialised_arguments = [
-            self._serialisation_manager.serialise(a) for a in arguments
+            self._serialisation_manager.serialise(a, memo=fragment_memo)
+            for a in arguments
         ]
         execution_id = self._request(
             SubmitExecutionRequest(
@@ -341,6 +413,8 @@ class Channel:
         elif isinstance(delay, dt.timedelta):
             execute_after = dt.datetime.now() + delay
         self._notify(SuspendRequest(execute_after, []))
+        # (the agent stops handling requests once the execution is suspended)
+        self._stop()
 
     def _resolve_arguments(
         self,
@@ -371,7 +445,13 @@ class Channel:
         except Exception as e:
             self._record_error(e)
         else:
-            self._record_result(value)
+            try:
+                for asset_id in self._pending_assets:
+                    asset_id.result()
+            except Exception as e:
+                self._record_error(e)
+            else:
+                self._record_result(value)
 
     def _deserialise_result(self, result: models.Result):
         match result:
@@ -403,19 +483,28 @@ class Channel:
             return self._deserialise_result(result)
         except Timeout:
             self._notify(SuspendRequest(None, [execution_id]))
+            self._stop()
 
     def _cancel_execution(self, execution_id: int) -> None:
         # TODO: wait for confirmation?
         self._notify(CancelExecutionRequest(execution_id))
 
     def record_checkpoint(self, arguments):
+        fragment_memo: serialisation.Memo = {}
         serialised_arguments = [
-            self._serialisation_manager.serialise(a) for a in arguments
+            self._serialisation_manager.serialise(a, memo=fragment_memo)
+            for a in arguments
         ]
         self._notify(RecordCheckpointRequest(serialised_arguments))
 
     def persist_asset(
-        self, path: Path | str | None = None, *, match: str | None = None
+        self,
+        path: Path | str | None = None,
+        *,
+        match: str | None = None,
+        archive: bool = False,
+        compress: bool = False,
+        background: bool = False,
     ) -> models.Asset:
         if isinstance(path, str):
             path = Path(path)
@@ -425,42 +514,84 @@ class Channel:
         path = path.resolve()
         if not path.is_relative_to(self._directory):
             raise Exception(f"path ({path}) not in execution directory")
-        # TODO: zip all assets?
-        path_str = str(path.relative_to(self._directory))
         if path.is_file():
             if match:
                 raise Exception("match cannot be specified for file")
+        elif path.is_dir():
+            if compress and not archive:
+                raise Exception("compress can only be specified for archive")
+        else:
+            raise Exception(f"path ({path}) isn't a file or a directory")
+        if background:
+            # the asset ID is resolved once the upload completes. pending uploads are
+            # waited for before the execution's result is recorded
+            asset_id = self._background_executor.submit(
+                self._persist_asset, path, match, archive, compress
+            )
+            self._pending_assets.append(asset_id)
+        else:
+            asset_id = self._persist_asset(path, match, archive, compress)
+        asset = models.Asset(
+            lambda to, match, link: self._restore_asset(asset.id, to, match, link),
+            asset_id,
+        )
+        return asset
+
+    def _persist_asset(
+        self, path: Path, match: str | None, archive: bool, compress: bool
+    ) -> int:
+        # TODO: zip all assets?
+        path_str = str(path.relative_to(self._directory))
+        if path.is_file():
             asset_type = 0
             blob_key = self._blob_manager.upload(path)
             (mime_type, _) = mimetypes.guess_type(path)
             size = path.stat().st_size
             metadata = {"type": mime_type}
-        elif path.is_dir():
-            asset_type = 1
-            sizes = []
-            with tempfile.NamedTemporaryFile() as zip_file:
-                zip_path = Path(zip_file.name)
-                with zipfile.ZipFile(zip_path, "w") as zip:
-                    for root, _, files in os.walk(path):
-                        root = Path(root)
-                        for file in files:
-                            file_path = root.joinpath(file)
-                            if not match or file_path.match(match):
-                                zip.write(
-                                    file_path, arcname=file_path.relative_to(path)
-                                )
-                                sizes.append(file_path.stat().st_size)
-                blob_key = self._blob_manager.upload(zip_path)
-            size = sum(sizes)
-            metadata = {"count": len(sizes)}
         else:
-            raise Exception(f"path ({path}) isn't a file or a directory")
-        asset_id = self._request(
+            asset_type = 1
+            file_paths = _walk_files(path, match)
+            stats = [p.stat() for p in file_paths]
+            if archive:
+                compression = zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+                # the archive is chunked (and uploaded) as it's written
+                with self._blob_manager.chunked_writer() as writer:
+                    with zipfile.ZipFile(writer, "w", compression) as zip_file:
+                        for file_path in file_paths:
+                            _write_zip_entry(
+                                zip_file, file_path, file_path.relative_to(path)
+                            )
+                    blob_key = writer.finish()
+                metadata = {"count": len(file_paths), "chunked": True}
+            else:
+                # a blob per file (so that unchanged files are deduplicated, and files
+                # can be restored individually), referenced from a manifest
+                blob_keys = self._blob_manager.upload_many(file_paths)
+                files = {
+                    file_path.relative_to(path).as_posix(): [
+                        file_key,
+                        file_stat.st_size,
+                        stat.S_IMODE(file_stat.st_mode),
+                    ]
+                    for file_path, file_key, file_stat in zip(
+                        file_paths, blob_keys, stats
+                    )
+                }
+                manifest = json.dumps({"files": files}, separators=(",", ":"))
+                blob_key = self._blob_manager.put(io.BytesIO(manifest.encode()))
+                metadata = {"count": len(files), "format": "files"}
+            size = sum(s.st_size for s in stats)
+        return self._request(
             PersistAssetRequest(asset_type, path_str, blob_key, size, metadata)
         )
-        return models.Asset(lambda to: self._restore_asset(asset_id, to=to), asset_id)
 
-    def _restore_asset(self, asset_id: int, to: Path | str | None = None) -> Path:
+    def _restore_asset(
+        self,
+        asset_id: int,
+        to: Path | str | None = None,
+        match: str | None = None,
+        link: bool = False,
+    ) -> Path:
         if to:
             if isinstance(to, str):
                 to = Path(to)
@@ -469,29 +600,60 @@ class Channel:
             if not to.is_relative_to(self._directory):
                 raise Exception("asset must be restored to execution directory")
         # TODO: use timeout?
-        asset_type, path_str, blob_key = self._request(
+        asset_type, path_str, blob_key, metadata = self._request(
             ResolveAssetRequest(asset_id), key=("asset", asset_id)
         )
         target = to or self._directory.joinpath(path_str)
         target.parent.mkdir(parents=True, exist_ok=True)
         if asset_type == 0:
-            self._blob_manager.download(blob_key, target)
+            if match:
+                raise Exception("match cannot be specified for file")
+            self._blob_manager.restore(blob_key, target, link=link)
         elif asset_type == 1:
             target.mkdir()
-            with tempfile.NamedTemporaryFile() as zip_file:
-                zip_path = Path(zip_file.name)
-                self._blob_manager.download(blob_key, zip_path)
-                with zipfile.ZipFile(zip_path, "r") as zip:
-                    zip.extractall(target)
+            if metadata.get("format") == "files":
+                self._restore_files(blob_key, target, match, link)
+            elif metadata.get("chunked"):
+                # chunks are fetched as they're needed for extraction
+                with self._blob_manager.open_chunked(blob_key) as zip_file:
+                    with zipfile.ZipFile(zip_file, "r") as zip:
+                        zip.extractall(target, _zip_members(zip, match))
+            else:
+                with tempfile.NamedTemporaryFile() as zip_file:
+                    zip_path = Path(zip_file.name)
+                    self._blob_manager.download(blob_key, zip_path)
+                    with zipfile.ZipFile(zip_path, "r") as zip:
+                        zip.extractall(target, _zip_members(zip, match))
         else:
             raise Exception(f"unrecognised asset type ({asset_type})")
         return target
 
+    def _restore_files(
+        self, manifest_key: str, target: Path, match: str | None, link: bool
+    ):
+        manifest = json.load(self._blob_manager.get(manifest_key))
+        files = {
+            target.joinpath(file_path): file
+            for file_path, file in manifest["files"].items()
+            if not match or PurePosixPath(file_path).match(match)
+        }
+        for file_path in files:
+            if not file_path.resolve().is_relative_to(target.resolve()):
+                raise Exception(f"invalid path in asset ({file_path})")
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+        self._blob_manager.restore_many(
+            [
+                (file_key, file_path, mode)
+                for file_path, (file_key, _, mode) in files.items()
+            ],
+            link,
+        )
+
     def log_message(self, level, template: str | None, **kwargs):
         timestamp = time.time() * 1000
 
         values = {
-            key: self._serialisation_manager.serialise(value)
+            key: self._serialisation_manager.serialise(value, canonical=False)
             for key, value in kwargs.items()
         }
         self._notify(
@@ -528,6 +690,8 @@ def _execute(
     serialiser_configs: list[config.SerialiserConfig],
     blob_threshold: int,
     blob_store_configs: list[config.BlobStoreConfig],
+    blob_cache_dir: str | None,
+    blob_cache_size: int,
     server_host: str,
     conn,
 ):
@@ -538,6 +702,8 @@ def _execute(
         serialiser_configs,
         blob_threshold,
         blob_store_configs,
+        blob_cache_dir,
+        blob_cache_size,
         server_host,
         conn,
     ) as channel:
@@ -552,73 +718,27 @@ def _execute(
             _channel_context = None
 
 
-def _json_safe_reference(reference: models.Reference) -> t.Any:
-    match reference:
-        case ("execution", execution_id):
-            return ["execution", execution_id]
-        case ("asset", asset_id):
-            return ["asset", asset_id]
-        case ("fragment", serialiser, blob_key, size, metadata):
-            return ["fragment", serialiser, blob_key, size, metadata]
-        case other:
-            raise Exception(f"unhandled reference type ({other})")
-
-
-def _json_safe_references(references: list[models.Reference]) -> list[t.Any]:
-    return [_json_safe_reference(r) for r in references]
-
-
-def _json_safe_value(value: models.Value):
-    # TODO: tidy
-    match value:
-        case ("raw", content, references):
-            return ["raw", content, _json_safe_references(references)]
-        case ("blob", key, size, references):
-            return ["blob", key, size, _json_safe_references(references)]
-
-
-def _json_safe_arguments(arguments: list[models.Value]):
-    return [_json_safe_value(v) for v in arguments]
+class _AssetCache:
+    # details of recently resolved assets, shared by executions (evicting the least
+    # recently used)
+    def __init__(self, size: int):
+        self._size = size
+        self._entries: collections.OrderedDict[int, t.Any] = collections.OrderedDict()
+        self._lock = threading.Lock()
 
+    def get(self, asset_id: int) -> t.Any | None:
+        with self._lock:
+            entry = self._entries.get(asset_id)
+            if entry is not None:
+                self._entries.move_to_end(asset_id)
+            return entry
 
-def _parse_reference(reference) -> models.Reference:
-    match reference:
-        case ["execution", execution_id]:
-            return ("execution", execution_id)
-        case ["asset", asset_id]:
-            return ("asset", asset_id)
-        case ["fragment", serialiser, blob_key, size, metadata]:
-            return ("fragment", serialiser, blob_key, size, metadata)
-        case other:
-            raise Exception(f"unrecognised reference: {other}")
-
-
-def _parse_references(references) -> list[models.Reference]:
-    return [_parse_reference(r) for r in references]
-
-
-def _parse_value(value: t.Any) -> models.Value:
-    match value:
-        case ["raw", content, references]:
-            return ("raw", content, _parse_references(references))
-        case ["blob", key, size, references]:
-            return ("blob", key, size, _parse_references(references))
-        case other:
-            raise Exception(f"unrecognised value: {other}")
-
-
-def _parse_result(result: t.Any) -> models.Result:
-    match result:
-        case ["error", type_, message]:
-            return ("error", type_, message)
-        case ["value", value]:
-            return ("value", _parse_value(value))
-        case ["abandoned"]:
-            return ("abandoned",)
-        case ["cancelled"]:
-            return ("cancelled",)
-        case other:
-            raise Exception(f"unrecognised result: {other}")
+    def put(self, asset_id: int, entry: t.Any) -> None:
+        with self._lock:
+            self._entries[asset_id] = entry
+            self._entries.move_to_end(asset_id)
+            if len(self._entries) > self._size:
+                self._entries.popitem(last=False)
 
 
 class Execution:
@@ -631,13 +751,17 @@ class Execution:
         serialiser_configs: list[config.SerialiserConfig],
         blob_threshold: int,
         blob_store_configs: list[config.BlobStoreConfig],
+        blob_cache_dir: str | None,
+        blob_cache_size: int,
         server_host: str,
         server_connection: server.Connection,
         loop: asyncio.AbstractEventLoop,
+        asset_cache: _AssetCache,
     ):
         self._id = execution_id
         self._server = server_connection
         self._loop = loop
+        self._asset_cache = asset_cache
         self._timestamp = time.time()  # TODO: better name
         self._status = ExecutionStatus.STARTING
         mp_context = multiprocessing.get_context("spawn")
@@ -653,6 +777,8 @@ class Execution:
                 serialiser_configs,
                 blob_threshold,
                 blob_store_configs,
+                blob_cache_dir,
+                blob_cache_size,
                 server_host,
                 child_conn,
             ),
@@ -714,6 +840,29 @@ class Execution:
         future = asyncio.run_coroutine_threadsafe(coro, self._loop)
         return future.result()
 
+    def _resolve_asset(self, asset_id: int, request_id: int) -> None:
+        # assets don't change, so a cached asset can be returned immediately, but the
+        # request is still made so that the server records the dependency
+        cached = self._asset_cache.get(asset_id)
+        if cached is not None:
+            self._try_send("success_result", (request_id, cached))
+
+        def _on_success(result):
+            self._asset_cache.put(asset_id, result)
+            if cached is None:
+                self._try_send("success_result", (request_id, result))
+
+        def _on_error(error):
+            if cached is None:
+                self._try_send("error_result", (request_id, error))
+
+        coro = self._server.request(
+            "get_asset",
+            (asset_id, self._id),
+            server.Callbacks(on_success=_on_success, on_error=_on_error),
+        )
+        asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
     def _try_send(
         self,
         type: t.Literal["success_result", "error_result"],
@@ -732,7 +881,7 @@ class Execution:
                 self._status = ExecutionStatus.STOPPING
                 self._server_notify(
                     "put_result",
-                    (self._id, _json_safe_value(value)),
+                    (self._id, value),
                 )
                 self._process.join()
             case RecordErrorRequest(error):
@@ -754,7 +903,7 @@ class Execution:
             case RecordCheckpointRequest(arguments):
                 self._server_notify(
                     "record_checkpoint",
-                    (self._id, _json_safe_arguments(arguments)),
+                    (self._id, arguments),
                 )
             case LogMessageRequest(level, template, values, timestamp):
                 self._server_notify(
@@ -787,7 +936,7 @@ class Execution:
                         repository,
                         target,
                         type,
-                        _json_safe_arguments(arguments),
+                        arguments,
                         self._id,
                         list(wait_for),
                         cache and cache._asdict(),
@@ -802,7 +951,10 @@ class Execution:
             case ResolveReferenceRequest(execution_id):
                 # TODO: set (and unset) state on Execution to indicate waiting?
                 self._server_request(
-                    "get_result", (execution_id, self._id), request_id, _parse_result
+                    "get_result",
+                    (execution_id, self._id),
+                    request_id,
+                    models.parse_result,
                 )
             case PersistAssetRequest(type, path, blob_key, size, metadata):
                 self._server_request(
@@ -811,7 +963,7 @@ class Execution:
                     request_id,
                 )
             case ResolveAssetRequest(asset_id):
-                self._server_request("get_asset", (asset_id, self._id), request_id)
+                self._resolve_asset(asset_id, request_id)
             case other:
                 raise Exception(f"Received unhandled request: {other!r}")
 
@@ -850,12 +1002,17 @@ class Manager:
         serialiser_configs: list[config.SerialiserConfig],
         blob_threshold: int,
         blob_store_configs: list[config.BlobStoreConfig],
+        blob_cache_dir: str | None,
+        blob_cache_size: int,
     ):
         self._connection = connection
         self._serialiser_configs = serialiser_configs
         self._blob_threshold = blob_threshold
         self._blob_store_configs = blob_store_configs
+        self._blob_cache_dir = blob_cache_dir
+        self._blob_cache_size = blob_cache_size
         self._executions: dict[str, Execution] = {}
+        self._asset_cache = _AssetCache(_ASSET_CACHE_SIZE)
         self._last_heartbeat_sent = None
 
     async def _declare_targets(
@@ -909,9 +1066,12 @@ class Manager:
             self._serialiser_configs,
             self._blob_threshold,
             self._blob_store_configs,
+            self._blob_cache_dir,
+            self._blob_cache_size,
             server_host,
             self._connection,
             loop,
+            self._asset_cache,
         )
         threading.Thread(
             target=self._run_execution,
@@ -1,3 +1,4 @@
+import concurrent.futures
 import typing as t
 from pathlib import Path
 
@@ -49,6 +50,16 @@ class Target(t.NamedTuple):
 
 Metadata = dict[str, t.Any]
 
+
+class Encoded:
+    # data that has already been encoded as JSON (so that it doesn't need to be
+    # re-encoded when it's sent to the server)
+    __slots__ = ("json",)
+
+    def __init__(self, json: str):
+        self.json = json
+
+
 Reference = (
     tuple[t.Literal["execution"], int]
     | tuple[t.Literal["asset"], int]
@@ -68,6 +79,44 @@ Result = t.Union[
 ]
 
 
+# values, references and results are decoded as lists, so are converted to tuples when
+# they're received (the contents aren't copied)
+def parse_reference(reference: t.Any) -> Reference:
+    match reference:
+        case ["execution", execution_id]:
+            return ("execution", execution_id)
+        case ["asset", asset_id]:
+            return ("asset", asset_id)
+        case ["fragment", format, blob_key, size, metadata]:
+            return ("fragment", format, blob_key, size, metadata)
+        case other:
+            raise Exception(f"unrecognised reference: {other}")
+
+
+def parse_value(value: t.Any) -> Value:
+    match value:
+        case ["raw", content, references]:
+            return ("raw", content, [parse_reference(r) for r in references])
+        case ["blob", key, size, references]:
+            return ("blob", key, size, [parse_reference(r) for r in references])
+        case other:
+            raise Exception(f"unrecognised value: {other}")
+
+
+def parse_result(result: t.Any) -> Result:
+    match result:
+        case ["error", type_, message]:
+            return ("error", type_, message)
+        case ["value", value]:
+            return ("value", parse_value(value))
+        case ["abandoned"]:
+            return ("abandoned",)
+        case ["cancelled"]:
+            return ("cancelled",)
+        case other:
+            raise Exception(f"unrecognised result: {other}")
+
+
 class Execution(t.Generic[T]):
     def __init__(
         self,
@@ -93,15 +142,24 @@ class Execution(t.Generic[T]):
 class Asset:
     def __init__(
         self,
-        restore_fn: t.Callable[[Path | str | None], Path],
-        id: int,
+        restore_fn: t.Callable[[Path | str | None, str | None, bool], Path],
+        id: int | concurrent.futures.Future[int],
     ):
         self._restore_fn = restore_fn
         self._id = id
 
     @property
     def id(self) -> int:
+        # (waits for the asset to be persisted, if it's being persisted in the background)
+        if isinstance(self._id, concurrent.futures.Future):
+            return self._id.result()
         return self._id
 
-    def restore(self, *, to: Path | str | None = None) -> Path:
-        return self._restore_fn(to)
+    def restore(
+        self,
+        *,
+        to: Path | str | None = None,
+        match: str | None = None,
+        link: bool = False,
+    ) -> Path:
+        return self._restore_fn(to, match, link)
@@ -2,10 +2,15 @@ import typing as t
 import json
 import pickle
 import abc
+import base64
 import io
+import mmap
 import pydantic
 import importlib
 import collections
+import itertools
+import re
+import weakref
 from pathlib import Path
 
 try:
@@ -13,41 +18,176 @@ try:
 except ImportError:
     pandas = None
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+try:
+    import polars
+except ImportError:
+    polars = None
+
 from . import blobs, models, config
 
 T = t.TypeVar("T")
 
 
+_PRIMITIVE_TYPES = frozenset({str, bool, int, float, type(None)})
+_STR_TYPES = frozenset({str})
+
+
+# characters for which the order of strings differs from the order of their `repr`
+# (due to quoting, escaping, or comparing with the closing quote)
+_REPR_UNSAFE = re.compile(r"[\x00-'\\]")
+
+
+def _sorted_items(value: dict[t.Any, t.Any]) -> t.Iterable[tuple[t.Any, t.Any]]:
+    # canonical order is by the `repr` of keys, but for (the common case of) string
+    # keys that don't contain any 'unsafe' characters, native sorting gives the same
+    # order, without calling `repr` for each key
+    if _STR_TYPES.issuperset(map(type, value)):
+        keys = "".join(value)
+        if keys.isprintable() and not _REPR_UNSAFE.search(keys):
+            return sorted(value.items())
+    return sorted(value.items(), key=lambda kv: repr(kv[0]))
+
+
+def _flatten(pairs: t.Iterable[tuple[t.Any, t.Any]]) -> list[t.Any]:
+    return list(itertools.chain.from_iterable(pairs))
+
+
+def _shallow(items: list[t.Any]) -> list[t.Any] | None:
+    if _PRIMITIVE_TYPES.issuperset(map(type, items)):
+        return items
+    result = []
+    for item in items:
+        if type(item) in _PRIMITIVE_TYPES:
+            result.append(item)
+        elif type(item) is list and _PRIMITIVE_TYPES.issuperset(map(type, item)):
+            result.append(list(item))
+        else:
+            return None
+    return result
+
+
+def _identity(x: T) -> T:
+    return x
+
+
+def _pairs(items: list[t.Any]) -> dict[t.Any, t.Any]:
+    iterator = iter(items)
+    return dict(zip(iterator, iterator))
+
+
+_BUILDERS: dict[str, t.Callable[[list[t.Any]], t.Any]] = {
+    "dict": _pairs,
+    "set": set,
+    "tuple": tuple,
+}
+
+
 def _json_dumps(obj: t.Any) -> str:
     return json.dumps(obj, separators=(",", ":"))
 
 
 class Serialiser(abc.ABC):
+    # the formats that the serialiser can deserialise
+    formats: t.ClassVar[tuple[str, ...]] = ()
+
+    def handles(self, type_: type) -> bool:
+        # whether values of the type might be serialised. this allows the serialiser to
+        # be skipped for other types, without checking each value
+        return True
+
+    def tracks(self, value: t.Any) -> bool:
+        # whether the fragment that a (deserialised) value was loaded from can be
+        # referenced again if the value is re-serialised. this is only safe if the value
+        # can't be modified
+        return False
+
     @abc.abstractmethod
     def serialise(self, value: t.Any) -> tuple[str, io.BytesIO, dict[str, t.Any]] | None:
         raise NotImplementedError
 
     @abc.abstractmethod
-    def deserialise(self, format: str, buffer: io.BytesIO, metadata: dict[str, t.Any]) -> t.Any | None:
+    def deserialise(self, format: str, blob: blobs.Blob, metadata: dict[str, t.Any]) -> t.Any | None:
         raise NotImplementedError
 
 
 class PickleSerialiser(Serialiser):
+    formats = ("pickle",)
+
+    def __init__(
+        self, blob_manager: blobs.Manager, buffer_threshold: int, provenance: bool
+    ):
+        self._blob_manager = blob_manager
+        self._buffer_threshold = buffer_threshold
+        self._provenance = provenance
+
+    def tracks(self, value: t.Any) -> bool:
+        return self._provenance
+
     def serialise(self, value: t.Any) -> tuple[str, io.BytesIO, dict[str, t.Any]] | None:
+        # (large) buffers that support out-of-band pickling (e.g., NumPy arrays) are
+        # stored as separate blobs, so that they don't need to be copied into (and out
+        # of) the pickle stream
+        buffers = []
+
+        def _buffer_callback(buffer: pickle.PickleBuffer) -> bool:
+            try:
+                data = buffer.raw()
+            except BufferError:
+                # (not contiguous)
+                return True
+            if data.nbytes < self._buffer_threshold:
+                return True
+            buffers.append(data)
+            return False
+
         try:
             buffer = io.BytesIO()
-            pickle.dump(value, buffer)
-            return "pickle", buffer, {"type": str(type(value))}
+            pickle.dump(value, buffer, protocol=5, buffer_callback=_buffer_callback)
         except pickle.PicklingError:
             return None
+        metadata: dict[str, t.Any] = {"type": str(type(value))}
+        if buffers:
+            metadata["buffers"] = [
+                [self._blob_manager.put(io.BytesIO(b)), b.nbytes] for b in buffers
+            ]
+        return "pickle", buffer, metadata
 
-    def deserialise(self, format: str, buffer: io.BytesIO, metadata: dict[str, t.Any]) -> t.Any | None:
+    def deserialise(self, format: str, blob: blobs.Blob, metadata: dict[str, t.Any]) -> t.Any | None:
         if format != "pickle":
             return None
-        return pickle.loads(buffer.getbuffer())
+        # buffers are memory-mapped (copy-on-write) from the host cache
+        buffers = []
+        for key, size in metadata.get("buffers", []):
+            path = blobs.Blob(self._blob_manager, key, size).path()
+            with path.open("rb") as file:
+                buffers.append(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY))
+        return pickle.loads(blob.load().getbuffer(), buffers=buffers)
 
 
 class PydanticSerialiser(Serialiser):
+    formats = ("json",)
+
+    def __init__(self, provenance: bool):
+        self._provenance = provenance
+
+    def handles(self, type_: type) -> bool:
+        return issubclass(type_, pydantic.BaseModel)
+
+    def tracks(self, value: t.Any) -> bool:
+        return self._provenance
+
     def serialise(self, value: t.Any) -> tuple[str, io.BytesIO, dict[str, t.Any]] | None:
         if not isinstance(value, pydantic.BaseModel):
             return None
@@ -58,10 +198,10 @@ class PydanticSerialiser(Serialiser):
         model = f"{model_class.__module__}.{model_class.__name__}"
         return "json", buffer, {"model": model}
 
-    def deserialise(self, format: str, buffer: io.BytesIO, metadata: dict[str, t.Any]) -> t.Any | None:
+    def deserialise(self, format: str, blob: blobs.Blob, metadata: dict[str, t.Any]) -> t.Any | None:
         if format != "json" or "model" not in metadata:
             return None
-        json_data = buffer.read().decode()
+        json_data = blob.load().read().decode()
         model = metadata["model"]
         module_name, class_name = model.rsplit(".", 1)
         # TODO: support configuring which modules can be loaded?
@@ -74,34 +214,315 @@ class PydanticSerialiser(Serialiser):
         return model_class.model_validate_json(json_data)
 
 
+class LazyDataFrame:
+    def __init__(self, blob: blobs.Blob, metadata: dict[str, t.Any]):
+        self._blob = blob
+        self._metadata = metadata
+        self._file = None
+
+    def _parquet_file(self):
+        if not pyarrow:
+            raise Exception("PyArrow dependency not available")
+        if self._file is None:
+            # only the footer is read initially
+            self._file = pyarrow.parquet.ParquetFile(self._blob.open())
+        return self._file
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return tuple(self._metadata["shape"])
+
+    @property
+    def columns(self) -> list[str]:
+        return self._parquet_file().schema_arrow.names
+
+    @property
+    def num_row_groups(self) -> int:
+        return self._parquet_file().num_row_groups
+
+    def load(
+        self,
+        columns: list[str] | None = None,
+        row_groups: list[int] | None = None,
+    ) -> t.Any:
+        file = self._parquet_file()
+        if row_groups is None:
+            table = file.read(columns, use_pandas_metadata=True)
+        else:
+            table = file.read_row_groups(row_groups, columns, use_pandas_metadata=True)
+        return table.to_pandas()
+
+
 class PandasSerialiser(Serialiser):
+    formats = ("parquet", "feather")
+
+    def __init__(
+        self,
+        lazy: bool,
+        format: t.Literal["parquet", "feather"],
+        compression: str | None,
+        compression_level: int | None,
+        index: bool | None,
+        provenance: bool,
+    ):
+        self._lazy = lazy
+        self._format = format
+        self._compression = compression
+        self._compression_level = compression_level
+        self._index = index
+        self._provenance = provenance
+
+    def handles(self, type_: type) -> bool:
+        return issubclass(type_, LazyDataFrame) or bool(
+            pandas
+            and issubclass(type_, (pandas.DataFrame, pandas.Series, pandas.Index))
+        )
+
+    def tracks(self, value: t.Any) -> bool:
+        # (lazy frames can't be modified)
+        return self._provenance or isinstance(value, LazyDataFrame)
+
     def serialise(self, value: t.Any) -> tuple[str, io.BytesIO, dict[str, t.Any]] | None:
-        # TODO: support series
-        if pandas and isinstance(value, pandas.DataFrame):
-            buffer = io.BytesIO()
-            value.to_parquet(buffer)
-            return "parquet", buffer, {"shape": value.shape}
+        if isinstance(value, LazyDataFrame):
+            value = value.load()
+        if not pandas:
+            return None
+        # series and indexes are stored as frames, with names in the metadata (names
+        # that can't be represented in metadata are left to other serialisers)
+        if isinstance(value, pandas.DataFrame):
+            frame = value
+            metadata = {"shape": value.shape}
+        elif isinstance(value, pandas.Series):
+            if type(value.name) not in _PRIMITIVE_TYPES:
+                return None
+            frame = value.to_frame("values")
+            metadata = {"shape": value.shape, "kind": "series", "name": value.name}
+        elif isinstance(value, pandas.Index):
+            if not _PRIMITIVE_TYPES.issuperset(map(type, value.names)):
+                return None
+            frame = pandas.DataFrame(
+                {f"level_{i}": value.get_level_values(i) for i in range(value.nlevels)}
+            )
+            metadata = {"shape": value.shape, "kind": "index", "names": value.names}
+        else:
+            return None
+        if not pyarrow:
+            raise Exception("PyArrow dependency not available")
+        index = self._index if metadata.get("kind") != "index" else False
+        table = pyarrow.Table.from_pandas(frame, preserve_index=index)
+        buffer = io.BytesIO()
+        if self._format == "feather":
+            compression = (
+                "uncompressed" if self._compression == "none" else self._compression
+            )
+            pyarrow.feather.write_feather(
+                table, buffer, compression, self._compression_level
+            )
+        else:
+            pyarrow.parquet.write_table(
+                table,
+                buffer,
+                compression=self._compression or "snappy",
+                compression_level=self._compression_level,
+            )
+        return self._format, buffer, metadata
 
-    def deserialise(self, format: str, buffer: io.BytesIO, metadata: dict[str, t.Any]) -> t.Any | None:
-        if format != "parquet":
+    def deserialise(self, format: str, blob: blobs.Blob, metadata: dict[str, t.Any]) -> t.Any | None:
+        if format not in self.formats:
             return None
         if not pandas:
             raise Exception("Pandas dependency not available")
-        # TODO: check metadata["content_type"]
-        return pandas.read_parquet(buffer)
+        kind = metadata.get("kind", "frame")
+        if self._lazy and format == "parquet" and kind == "frame":
+            return LazyDataFrame(blob, metadata)
+        if format == "feather":
+            if not pyarrow:
+                raise Exception("PyArrow dependency not available")
+            # memory-mapped from the host cache
+            path = str(blob.path())
+            frame = pyarrow.feather.read_table(path, memory_map=True).to_pandas()
+        else:
+            frame = pandas.read_parquet(blob.load())
+        match kind:
+            case "series":
+                return frame.iloc[:, 0].rename(metadata["name"])
+            case "index":
+                names = metadata["names"]
+                if len(names) == 1:
+                    return pandas.Index(frame.iloc[:, 0], name=names[0])
+                return pandas.MultiIndex.from_frame(frame, names=names)
+            case _:
+                return frame
+
+
+class NumpySerialiser(Serialiser):
+    formats = ("npy",)
+
+    def __init__(self, mmap: bool):
+        self._mmap = mmap
+
+    def handles(self, type_: type) -> bool:
+        return bool(numpy and type_ in (numpy.ndarray, numpy.memmap))
+
+    def tracks(self, value: t.Any) -> bool:
+        # (memory-mapped arrays are read-only)
+        return self._mmap
+
+    def serialise(self, value: t.Any) -> tuple[str, io.BytesIO, dict[str, t.Any]] | None:
+        # (subclasses, such as masked arrays, and object arrays are left to other
+        # serialisers, since they can't be represented in the format)
+        if (
+            numpy
+            and type(value) in (numpy.ndarray, numpy.memmap)
+            and not value.dtype.hasobject
+        ):
+            buffer = io.BytesIO()
+            numpy.save(buffer, value, allow_pickle=False)
+            return "npy", buffer, {"dtype": str(value.dtype), "shape": value.shape}
+
+    def deserialise(self, format: str, blob: blobs.Blob, metadata: dict[str, t.Any]) -> t.Any | None:
+        if format != "npy":
+            return None
+        if not numpy:
+            raise Exception("NumPy dependency not available")
+        if self._mmap:
+            # memory-mapped (read-only) from the host cache, so data is only read as
+            # it's accessed
+            return numpy.load(blob.path(), mmap_mode="r", allow_pickle=False)
+        return numpy.load(blob.load(), allow_pickle=False)
+
 
+class ArrowSerialiser(Serialiser):
+    formats = ("arrow",)
 
-def _create(config_: config.SerialiserConfig):
+    def __init__(self, compression: t.Literal["lz4", "zstd"] | None):
+        self._compression = compression
+
+    def handles(self, type_: type) -> bool:
+        return bool(
+            (pyarrow and issubclass(type_, (pyarrow.Table, pyarrow.RecordBatch)))
+            or (polars and issubclass(type_, polars.DataFrame))
+        )
+
+    def tracks(self, value: t.Any) -> bool:
+        # (Arrow data is immutable, but Polars frames can be modified)
+        return not (polars and isinstance(value, polars.DataFrame))
+
+    def serialise(self, value: t.Any) -> tuple[str, io.BytesIO, dict[str, t.Any]] | None:
+        # (PyArrow is also needed for Polars frames)
+        if not pyarrow:
+            return None
+        if isinstance(value, pyarrow.Table):
+            type_, table = "table", value
+        elif isinstance(value, pyarrow.RecordBatch):
+            type_, table = "record_batch", value
+        elif polars and isinstance(value, polars.DataFrame):
+            type_, table = "polars", value.to_arrow()
+        else:
+            return None
+        buffer = io.BytesIO()
+        options = pyarrow.ipc.IpcWriteOptions(compression=self._compression)
+        with pyarrow.ipc.new_file(buffer, table.schema, options=options) as writer:
+            writer.write(table)
+        metadata = {"type": type_, "shape": [table.num_rows, table.num_columns]}
+        return "arrow", buffer, metadata
+
+    def deserialise(self, format: str, blob: blobs.Blob, metadata: dict[str, t.Any]) -> t.Any | None:
+        if format != "arrow":
+            return None
+        if not pyarrow:
+            raise Exception("PyArrow dependency not available")
+        # memory-mapped from the host cache, so (uncompressed) buffers aren't copied.
+        # (the loaded buffers reference the mapping, so remain valid once the file is
+        # closed)
+        with pyarrow.memory_map(str(blob.path())) as source:
+            reader = pyarrow.ipc.open_file(source)
+            match metadata.get("type"):
+                case "record_batch":
+                    return reader.get_batch(0)
+                case "polars":
+                    if not polars:
+                        raise Exception("Polars dependency not available")
+                    return polars.from_arrow(reader.read_all())
+                case _:
+                    return reader.read_all()
+
+
+def _create(
+    config_: config.SerialiserConfig, blob_manager: blobs.Manager
+) -> Serialiser:
     if config_.type == "pickle":
-        return PickleSerialiser()
+        return PickleSerialiser(
+            blob_manager, config_.buffer_threshold, config_.provenance
+        )
     elif config_.type == "pydantic":
-        return PydanticSerialiser()
+        return PydanticSerialiser(config_.provenance)
     elif config_.type == "pandas":
-        return PandasSerialiser()
+        return PandasSerialiser(
+            config_.lazy,
+            config_.format,
+            config_.compression,
+            config_.compression_level,
+            config_.index,
+            config_.provenance,
+        )
+    elif config_.type == "numpy":
+        return NumpySerialiser(config_.mmap)
+    elif config_.type == "arrow":
+        return ArrowSerialiser(config_.compression)
     else:
         raise ValueError("unrecognised serialiser config")
 
 
+class _Cache:
+    # a least-recently-used cache, bounded by the total size of values (which is
+    # approximated by the size of the fragment)
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._size = 0
+        self._entries: collections.OrderedDict[t.Any, tuple[t.Any, int]] = (
+            collections.OrderedDict()
+        )
+
+    def __contains__(self, key: t.Any) -> bool:
+        return key in self._entries
+
+    def get(self, key: t.Any) -> t.Any:
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key: t.Any, value: t.Any, size: int) -> None:
+        if size > self._max_size or key in self._entries:
+            return
+        self._entries[key] = (value, size)
+        self._size += size
+        while self._size > self._max_size:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+
+def _fragment_key(format: str, blob_key: str, metadata: dict[str, t.Any]) -> tuple:
+    # identifies a fragment in the same way as the server (the same content can be
+    # deserialised differently depending on the metadata - e.g., the dtype and shape)
+    return (
+        format,
+        blob_key,
+        *itertools.chain.from_iterable(
+            (k, json.dumps(v, sort_keys=True, separators=(",", ":")))
+            for k, v in sorted(metadata.items())
+        ),
+    )
+
+
+# a serialised fragment is either a reference (to a blob), or, if it's small enough, a
+# data node containing the (encoded) content
+Fragment = models.Reference | dict[str, t.Any]
+
+# maps the ID of each serialised object to the object (which keeps it alive, so that the
+# ID isn't reused) and its fragment
+Memo = dict[int, tuple[t.Any, Fragment]]
+
+
 class Manager:
     def __init__(
         self,
@@ -109,66 +530,121 @@ class Manager:
         blob_threshold: int,
         blob_manager: blobs.Manager,
     ):
-        self._serialisers = [_create(c) for c in serialiser_configs]
+        self._serialisers = [_create(c, blob_manager) for c in serialiser_configs]
+        # deserialised values are (optionally) cached per serialiser. since fragments
+        # are content-addressed, the same fragment always deserialises to an equal
+        # value, but the same object is returned for each use, so modifications would
+        # be shared. each execution runs in its own process, so the cache isn't shared
+        # between executions
+        self._caches = {
+            s: _Cache(c.cache_size)
+            for s, c in zip(self._serialisers, serialiser_configs)
+            if c.cache_size
+        }
         self._blob_threshold = blob_threshold
         self._blob_manager = blob_manager
+        # the serialisers that handle each type (populated as types are encountered).
+        # the manager is created from the serialiser configs, so this doesn't need
+        # invalidating
+        self._dispatch: dict[type, list[Serialiser]] = {}
+        self._deserialisers: dict[str, list[Serialiser]] = {}
+        # the fragments that (tracked) deserialised objects were loaded from, keyed by
+        # the object's ID, with a weak reference to check that the ID hasn't been
+        # reused (values aren't necessarily hashable, so can't be weak keys)
+        self._provenance: dict[int, tuple[weakref.ref, Fragment]] = {}
+        for serialiser in self._serialisers:
+            for format in serialiser.formats:
+                self._deserialisers.setdefault(format, []).append(serialiser)
 
-    def serialise(self, value: t.Any) -> models.Value:
+    def serialise(
+        self,
+        value: t.Any,
+        *,
+        canonical: bool = True,
+        memo: "Memo | None" = None,
+    ) -> models.Value:
+        # values are serialised canonically (i.e., with dicts and sets sorted) so that
+        # equal values are serialised identically (e.g., for cache keys). this can be
+        # skipped for values that won't be compared
         references: list[models.Reference] = []
-
-        def _serialise(value: t.Any) -> t.Any:
-            if value is None or isinstance(value, (str, bool, int, float)):
-                return value
-            elif isinstance(value, list):
-                return [_serialise(v) for v in value]
-            elif isinstance(value, dict):
-                items = (
-                    value.items()
-                    if isinstance(value, collections.OrderedDict)
-                    else sorted(value.items(), key=lambda kv: repr(kv[0]))
-                )
-                return {
-                    "type": "dict",
-                    "items": [_serialise(x) for kv in items for x in kv],
-                }
-            elif isinstance(value, set):
-                return {
-                    "type": "set",
-                    "items": [_serialise(x) for x in sorted(value)],
-                }
-            elif isinstance(value, models.Execution):
-                # TODO: better handle id being none
-                assert value.id is not None
-                references.append(("execution", value.id))
-                return {"type": "ref", "index": len(references) - 1}
-            elif isinstance(value, models.Asset):
-                references.append(("asset", value.id))
-                return {"type": "ref", "index": len(references) - 1}
-            elif isinstance(value, tuple):
-                # TODO: include name
-                return {"type": "tuple", "items": [_serialise(x) for x in value]}
+        # fragments are memoised by identity, so that an object that appears multiple
+        # times (within the value, or across values sharing a memo) is only serialised
+        # (and uploaded) once, and is referenced by a single index within the value
+        memo = memo if memo is not None else {}
+        indexes: dict[int, int] = {}
+        # the space (in the encoded value) left for inlined fragments, so that they
+        # don't push the value over the threshold (in which case it would be stored
+        # as a blob anyway)
+        budget = self._blob_threshold
+        # iterative (rather than recursive), to avoid the overhead of a call per value.
+        # (the result is still encoded/decoded with `json`, which is recursive, so the
+        # nesting depth is still limited.) `pending` holds (output, items) pairs, where
+        # serialised items are appended to `output` in order, so references are
+        # numbered in the same (depth-first) order
+        root: list[t.Any] = []
+        pending = [(root, iter((value,)))]
+        while pending:
+            output, items = pending[-1]
+            for item in items:
+                if type(item) in _PRIMITIVE_TYPES or isinstance(
+                    item, (str, bool, int, float)
+                ):
+                    output.append(item)
+                elif isinstance(item, list):
+                    if _PRIMITIVE_TYPES.issuperset(map(type, item)):
+                        output.append(list(item))
+                    else:
+                        output.append([])
+                        pending.append((output[-1], iter(item)))
+                        break
+                elif isinstance(item, dict):
+                    pairs = (
+                        item.items()
+                        if not canonical or isinstance(item, collections.OrderedDict)
+                        else _sorted_items(item)
+                    )
+                    if self._push_items("dict", _flatten(pairs), output, pending):
+                        break
+                elif isinstance(item, set):
+                    members = sorted(item) if canonical else list(item)
+                    if self._push_items("set", members, output, pending):
+                        break
+                elif isinstance(item, models.Execution):
+                    # TODO: better handle id being none
+                    assert item.id is not None
+                    references.append(("execution", item.id))
+                    output.append({"type": "ref", "index": len(references) - 1})
+                elif isinstance(item, models.Asset):
+                    references.append(("asset", item.id))
+                    output.append({"type": "ref", "index": len(references) - 1})
+                elif isinstance(item, tuple):
+                    # TODO: include name
+                    if self._push_items("tuple", list(item), output, pending):
+                        break
+                else:
+                    if id(item) not in memo:
+                        memo[id(item)] = (item, self._serialise_fragment(item, budget))
+                    fragment = memo[id(item)][1]
+                    if isinstance(fragment, dict):
+                        output.append(fragment)
+                        budget -= len(_json_dumps(fragment))
+                    else:
+                        index = indexes.get(id(item))
+                        if index is None:
+                            references.append(fragment)
+                            index = indexes[id(item)] = len(references) - 1
+                        output.append({"type": "ref", "index": index})
             else:
-                for serialiser in self._serialisers:
-                    result = serialiser.serialise(value)
-                    if result is not None:
-                        format, buffer, metadata = result
-                        blob_key = self._blob_manager.put(buffer)
-                        size = buffer.getbuffer().nbytes
-                        references.append(
-                            ("fragment", format, blob_key, size, metadata)
-                        )
-                        return {"type": "ref", "index": len(references) - 1}
-                raise Exception(f"no serialiser for type '{type(value)}'")
-
-        data = _serialise(value)
-        encoded_data = _json_dumps(data).encode()
-        size = len(encoded_data)
+                pending.pop()
+        encoded = _json_dumps(root[0])
+        # (the encoding is ASCII, so the length is the size in bytes)
+        size = len(encoded)
         if size > self._blob_threshold:
-            buffer = io.BytesIO(encoded_data)
+            buffer = io.BytesIO(encoded.encode())
             blob_key = self._blob_manager.put(buffer)
             return ("blob", blob_key, size, references)
         else:
-            return ("raw", data, references)
+            return ("raw", models.Encoded(encoded), references)
 
     def _get_value_data(
         self, value: models.Value
@@ -177,6 +653,8 @@ class Manager:
             case ("blob", key, _, references):
                 result = self._blob_manager.get(key)
                 return json.load(result), references
+            case ("raw", models.Encoded() as encoded, references):
+                return json.loads(encoded.json), references
             case ("raw", data, references):
                 return data, references
 
@@ -185,47 +663,161 @@ class Manager:
         value: models.Value,
         resolve_fn: t.Callable[[int], t.Any],
         cancel_fn: t.Callable[[int], None],
-        restore_fn: t.Callable[[int, Path | str | None], Path],
+        restore_fn: t.Callable[[int, Path | str | None, str | None, bool], Path],
     ) -> t.Any:
         data, references = self._get_value_data(value)
-
-        def _deserialise(data: t.Any):
-            if data is None or isinstance(data, (str, bool, int, float)):
-                return data
-            elif isinstance(data, list):
-                return [_deserialise(v) for v in data]
-            elif isinstance(data, dict):
-                match data["type"]:
-                    case "dict":
-                        pairs = zip(data["items"][::2], data["items"][1::2])
-                        return {_deserialise(k): _deserialise(v) for k, v in pairs}
-                    case "set":
-                        return {_deserialise(x) for x in data["items"]}
-                    case "tuple":
-                        return tuple(_deserialise(x) for x in data["items"])
-                    case "ref":
-                        reference = references[data["index"]]
-                        match reference:
-                            case ("execution", execution_id):
-                                return models.Execution(
-                                    lambda: resolve_fn(execution_id),
-                                    lambda: cancel_fn(execution_id),
-                                    execution_id,
-                                )
-                            case ("asset", asset_id):
-                                return models.Asset(
-                                    lambda to: restore_fn(asset_id, to), asset_id
-                                )
-                            case ("fragment", format, blob_key, _size, metadata):
-                                data = self._blob_manager.get(blob_key)
-                                for serialiser in self._serialisers:
-                                    result = serialiser.deserialise(format, data, metadata)
-                                    if result is not None:
-                                        return result
-                                raise Exception(f"Couldn't deserialise fragment ({format})")
-                    case other:
-                        raise Exception(f"unhandled data type ({other})")
+        # iterative, like `serialise`. containers are built once their items have been
+        # deserialised (since tuples are immutable, and dict keys and set items need
+        # to be hashable)
+        root: list[t.Any] = []
+        pending: list[tuple[t.Callable[[list], t.Any], t.Iterator, list]] = [
+            (_identity, iter((data,)), root)
+        ]
+        while pending:
+            _, items, output = pending[-1]
+            for item in items:
+                if type(item) in _PRIMITIVE_TYPES or isinstance(
+                    item, (str, bool, int, float)
+                ):
+                    output.append(item)
+                elif isinstance(item, list):
+                    if _PRIMITIVE_TYPES.issuperset(map(type, item)):
+                        output.append(list(item))
+                    else:
+                        pending.append((_identity, iter(item), []))
+                        break
+                elif isinstance(item, dict):
+                    build = _BUILDERS.get(item["type"])
+                    if build:
+                        values = item["items"]
+                        if _PRIMITIVE_TYPES.issuperset(map(type, values)):
+                            output.append(build(values))
+                        else:
+                            pending.append((build, iter(values), []))
+                            break
+                    elif item["type"] == "ref":
+                        reference = references[item["index"]]
+                        output.append(
+                            self._deserialise_reference(
+                                reference, resolve_fn, cancel_fn, restore_fn
+                            )
+                        )
+                    elif item["type"] == "inline":
+                        output.append(self._deserialise_inline(item))
+                    else:
+                        raise Exception(f"unhandled data type ({item['type']})")
+                else:
+                    raise Exception(f"unhandled data type ({type(item)})")
             else:
-                raise Exception(f"unhandled data type ({type(data)})")
+                build, _, values = pending.pop()
+                if pending:
+                    pending[-1][2].append(build(values))
+        return root[0]
 
-        return _deserialise(data)
+    def _push_items(
+        self, type_: str, items: list[t.Any], output: list[t.Any], pending: list
+    ) -> bool:
+        # returns whether the items need to be serialised (i.e., they aren't all
+        # primitives, or lists of primitives), in which case they've been added to
+        # `pending`
+        shallow = _shallow(items)
+        if shallow is not None:
+            output.append({"type": type_, "items": shallow})
+            return False
+        output.append({"type": type_, "items": []})
+        pending.append((output[-1]["items"], iter(items)))
+        return True
+
+    def _serialise_fragment(self, value: t.Any, budget: int) -> Fragment:
+        provenance = self._provenance.get(id(value))
+        if provenance and provenance[0]() is value:
+            return provenance[1]
+        value_type = type(value)
+        serialisers = self._dispatch.get(value_type)
+        if serialisers is None:
+            serialisers = [s for s in self._serialisers if s.handles(value_type)]
+            self._dispatch[value_type] = serialisers
+        for serialiser in serialisers:
+            result = serialiser.serialise(value)
+            if result is not None:
+                break
+        else:
+            raise Exception(f"no serialiser for type '{value_type}'")
+        format, buffer, metadata = result
+        size = buffer.getbuffer().nbytes
+        # small fragments are inlined in the value, to avoid storing (and later
+        # fetching) a blob, if they fit once encoded (base64 encoding increases the
+        # size by a third, and the format and metadata are included)
+        if (size + 2) // 3 * 4 <= budget:
+            fragment = {
+                "type": "inline",
+                "format": format,
+                "content": base64.b64encode(buffer.getvalue()).decode(),
+                "metadata": metadata,
+            }
+            if len(_json_dumps(fragment)) <= budget:
+                return fragment
+        blob_key = self._blob_manager.put(buffer)
+        return ("fragment", format, blob_key, size, metadata)
+
+    def _deserialise_reference(
+        self,
+        reference: models.Reference,
+        resolve_fn: t.Callable[[int], t.Any],
+        cancel_fn: t.Callable[[int], None],
+        restore_fn: t.Callable[[int, Path | str | None, str | None, bool], Path],
+    ) -> t.Any:
+        match reference:
+            case ("execution", execution_id):
+                return models.Execution(
+                    lambda: resolve_fn(execution_id),
+                    lambda: cancel_fn(execution_id),
+                    execution_id,
+                )
+            case ("asset", asset_id):
+                return models.Asset(
+                    lambda to, match, link: restore_fn(asset_id, to, match, link),
+                    asset_id,
+                )
+            case ("fragment", format, blob_key, size, metadata):
+                blob = blobs.Blob(self._blob_manager, blob_key, size)
+                return self._deserialise_blob(format, blob, metadata, reference)
+
+    def _deserialise_inline(self, data: dict[str, t.Any]) -> t.Any:
+        content = base64.b64decode(data["content"])
+        blob = blobs.InlineBlob(self._blob_manager, content)
+        return self._deserialise_blob(data["format"], blob, data["metadata"], data)
+
+    def _deserialise_blob(
+        self,
+        format: str,
+        blob: blobs.Blob,
+        metadata: dict[str, t.Any],
+        fragment: Fragment,
+    ) -> t.Any:
+        key = _fragment_key(format, blob.key, metadata)
+        for serialiser in self._deserialisers.get(format, []):
+            cache = self._caches.get(serialiser)
+            if cache and key in cache:
+                return cache.get(key)
+            result = serialiser.deserialise(format, blob, metadata)
+            if result is not None:
+                if serialiser.tracks(result):
+                    self._track(result, fragment)
+                if cache:
+                    cache.put(key, result, blob.size)
+                return result
+        raise Exception(f"Couldn't deserialise fragment ({format})")
+
+    def _track(self, value: t.Any, fragment: Fragment) -> None:
+        key = id(value)
+
+        def _forget(ref: weakref.ref) -> None:
+            if self._provenance.get(key, (None,))[0] is ref:
+                del self._provenance[key]
+
+        try:
+            self._provenance[key] = (weakref.ref(value, _forget), fragment)
+        except TypeError:
+            # (doesn't support weak references)
+            pass
@@ -1,30 +1,157 @@
 import collections
 import asyncio
-import json
+import os
+import struct
+import tempfile
+import threading
+import time
 import typing as t
 
+from . import codec, config
+
+# the maximum number of (queued) messages to send in a single frame
+_MAX_BATCH_SIZE = 100
+
+# queued messages are sent in order of priority ('lane'), so that control messages
+# (e.g., heartbeats and results) aren't delayed by bulk messages (logs and
+# checkpoints). termination notifications are treated as bulk messages, so that they
+# follow any logs/checkpoints for the execution (which the server would otherwise
+# reject)
+_LANES = ("control", "bulk")
+_BULK_REQUESTS = {"log_messages", "record_checkpoint", "notify_terminated"}
+
+# the queue is bounded (by the number and size of messages), but control messages
+# are always queued. when the queue is full, bulk messages that can be spilled are
+# written to disk (to be sent once the queue has been drained), and other bulk
+# messages (i.e., checkpoints) wait until there's space, which (indirectly) blocks
+# the execution. log messages are dropped if the spill file is also full
+_SPILLABLE_REQUESTS = {"log_messages", "notify_terminated"}
+_DROPPABLE_REQUESTS = {"log_messages"}
+
+_SPILL_HEADER = struct.Struct("<d?I")
+
 
 class Callbacks(t.NamedTuple):
     on_success: t.Callable
     on_error: t.Callable
 
 
+class _Message(t.NamedTuple):
+    lane: int
+    enqueued_at: float
+    content: str | bytes
+    # the size of the (UTF-8 encoded) content, in bytes
+    size: int
+
+
+def _byte_size(content: str | bytes) -> int:
+    # (avoids encoding ASCII strings, which are most messages)
+    if isinstance(content, bytes) or content.isascii():
+        return len(content)
+    return len(content.encode())
+
+
+class _Spill:
+    # a first-in-first-out buffer of (encoded) messages, in a temporary file. the file is
+    # read and written in threads (so that the event loop isn't blocked), so access to
+    # it is synchronised
+    def __init__(self, directory: str | None):
+        self._directory = directory
+        self._lock = threading.Lock()
+        self._file: t.BinaryIO | None = None
+        self._read_position = 0
+        self._size = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def append(self, message: _Message) -> None:
+        content = message.content
+        is_text = isinstance(content, str)
+        data = content.encode() if isinstance(content, str) else content
+        header = _SPILL_HEADER.pack(message.enqueued_at, is_text, len(data))
+        with self._lock:
+            if self._file is None:
+                self._file = tempfile.TemporaryFile(dir=self._directory)
+            self._file.seek(0, os.SEEK_END)
+            self._file.write(header)
+            self._file.write(data)
+            self._size += _SPILL_HEADER.size + len(data)
+            self._count += 1
+
+    def pop_many(self, lane: int, limit: int) -> list[_Message]:
+        with self._lock:
+            return [self._pop(lane) for _ in range(min(limit, self._count))]
+
+    def _pop(self, lane: int) -> _Message:
+        assert self._file and self._count
+        self._file.seek(self._read_position)
+        header = self._file.read(_SPILL_HEADER.size)
+        enqueued_at, is_text, length = _SPILL_HEADER.unpack(header)
+        data = self._file.read(length)
+        self._read_position += _SPILL_HEADER.size + length
+        self._count -= 1
+        if not self._count:
+            # (the file is reused once it's been drained)
+            self._file.truncate(0)
+            self._read_position = 0
+            self._size = 0
+        return _Message(lane, enqueued_at, data.decode() if is_text else data, length)
+
+
+class QueueStats(t.NamedTuple):
+    # the number of messages sent, and how long they waited in the queue (in seconds)
+    sent: int
+    mean_wait: float
+    max_wait: float
+
+
 class Connection:
     def __init__(
         self,
         handlers: dict[str, t.Callable[..., t.Awaitable[None]]],
+        format: t.Literal["json", "msgpack"] = "json",
+        queue_config: config.QueueConfig | None = None,
     ):
+        if format == "msgpack" and not codec.msgpack:
+            raise Exception("msgpack must be installed to use the 'msgpack' format")
         self._handlers = handlers
+        self._format = format
         self._last_id = 0
         self._requests: dict[int, Callbacks] = {}
         self._session_id = None
-        self._queue = collections.deque()
+        self._queue_config = queue_config or config.QueueConfig()
+        self._queues: list[collections.deque[_Message]] = [
+            collections.deque() for _ in _LANES
+        ]
+        # the number and (total) size of messages in the (in-memory) queues
+        self._queued_count = 0
+        self._queued_size = 0
+        self._spill = _Spill(self._queue_config.spill_dir)
+        # spill file I/O is done without holding the condition's lock (so that control
+        # messages aren't queued behind it). messages are spilled in order, using a
+        # separate (fair) lock, and messages that are being spilled are counted, so that
+        # subsequent bulk messages are spilled after them
+        self._spill_lock = asyncio.Lock()
+        self._spilling = 0
+        self._dropped = 0
+        # the count, total wait and maximum wait for each lane
+        self._waits = [[0, 0.0, 0.0] for _ in _LANES]
         self._cond = asyncio.Condition()
 
     @property
     def session_id(self):
         return self._session_id
 
+    @property
+    def format(self) -> str:
+        return self._format
+
     async def notify(self, request: str, params: tuple) -> None:
         await self._enqueue(request, params)
 
@@ -44,6 +171,21 @@ class Connection:
         for task in done:
             task.result()
 
+    def queue_stats(self) -> dict[str, QueueStats]:
+        # returns (and resets) the stats for messages sent since the last call
+        stats = {
+            lane: QueueStats(count, total / count if count else 0.0, max_)
+            for lane, (count, total, max_) in zip(_LANES, self._waits)
+        }
+        self._waits = [[0, 0.0, 0.0] for _ in _LANES]
+        return stats
+
+    def take_dropped(self) -> int:
+        # returns (and resets) the number of messages dropped since the last call
+        dropped = self._dropped
+        self._dropped = 0
+        return dropped
+
     def reset(self):
         self._session_id = None
         self._last_id = 0
@@ -57,9 +199,73 @@ class Connection:
             data["params"] = params
         if id is not None:
             data["id"] = id
+        lane = 1 if request in _BULK_REQUESTS else 0
+        content = self._encode(data)
+        message = _Message(lane, time.monotonic(), content, _byte_size(content))
         async with self._cond:
-            self._queue.append(data)
-            self._cond.notify()
+            if lane == 0 or self._has_space(message):
+                self._push(message)
+                self._cond.notify_all()
+                return
+            if request not in _SPILLABLE_REQUESTS:
+                await self._cond.wait_for(lambda: self._has_space(message))
+                self._push(message)
+                self._cond.notify_all()
+                return
+            if (
+                request in _DROPPABLE_REQUESTS
+                and self._spill.size + message.size > self._queue_config.max_spill_bytes
+            ):
+                self._dropped += 1
+                return
+            self._spilling += 1
+        # (the spill lock is acquired without yielding after the condition's lock is
+        # released, so messages are spilled in the order they were enqueued)
+        try:
+            async with self._spill_lock:
+                await asyncio.to_thread(self._spill.append, message)
+        finally:
+            async with self._cond:
+                self._spilling -= 1
+                self._cond.notify_all()
+
+    def _has_space(self, message: _Message) -> bool:
+        # (spilled messages must be sent first, to preserve the order of messages. a
+        # message is always accepted into an empty queue, regardless of its size)
+        return not self._spill and not self._spilling and (
+            not self._queued_count
+            or (
+                self._queued_count < self._queue_config.max_messages
+                and self._queued_size + message.size
+                <= self._queue_config.max_bytes
+            )
+        )
+
+    def _push(self, message: _Message, front: bool = False) -> None:
+        if front:
+            self._queues[message.lane].appendleft(message)
+        else:
+            self._queues[message.lane].append(message)
+        self._queued_count += 1
+        self._queued_size += message.size
+
+    def _pop(self, lane: int) -> _Message:
+        message = self._queues[lane].popleft()
+        self._queued_count -= 1
+        self._queued_size -= message.size
+        return message
+
+    def _encode(self, data: dict[str, t.Any]) -> str | bytes:
+        if self._format == "msgpack":
+            return codec.pack(data)
+        return codec.dumps(data)
+
+    def _join(self, messages: list[t.Any]) -> str | bytes:
+        if len(messages) == 1:
+            return messages[0]
+        if self._format == "msgpack":
+            return codec.join_packed(messages)
+        return codec.join(messages)
 
     def _next_id(self) -> int:
         self._last_id += 1
@@ -67,7 +273,14 @@ class Connection:
 
     async def _receive(self, websocket) -> None:
         async for message in websocket:
-            match json.loads(message):
+            # (the server may respond with JSON when it can't encode a message with
+            # MessagePack)
+            data = (
+                codec.unpack(message)
+                if isinstance(message, bytes)
+                else codec.loads(message)
+            )
+            match data:
                 case [0, session_id]:
                     self._session_id = session_id
                 case [1, data]:
@@ -81,14 +294,42 @@ class Connection:
                     self._requests[request_id].on_error(error)
                     del self._requests[request_id]
 
+    def _take_batch(self) -> list[_Message]:
+        batch = []
+        for lane, queue in enumerate(self._queues):
+            while queue and len(batch) < _MAX_BATCH_SIZE:
+                batch.append(self._pop(lane))
+        return batch
+
     async def _send(self, websocket) -> t.NoReturn:
         while True:
             async with self._cond:
-                await self._cond.wait_for(lambda: self._queue)
-                while self._queue:
-                    data = self._queue.popleft()
-                    try:
-                        await websocket.send(json.dumps(data))
-                    except Exception:
-                        self._queue.appendleft(data)
-                        raise
+                await self._cond.wait_for(lambda: any(self._queues) or self._spill)
+                batch = self._take_batch()
+                self._cond.notify_all()
+            # (spilled messages are newer than any queued bulk messages. they're read
+            # without holding the condition's lock, but bulk messages continue to be
+            # spilled until the spill file has been drained, so the order is kept)
+            if self._spill and len(batch) < _MAX_BATCH_SIZE:
+                batch.extend(
+                    await asyncio.to_thread(
+                        self._spill.pop_many, 1, _MAX_BATCH_SIZE - len(batch)
+                    )
+                )
+                async with self._cond:
+                    self._cond.notify_all()
+            # queued messages are sent together (as an array). the lock isn't held
+            # while sending, so that messages can be queued (and prioritised) meanwhile
+            try:
+                await websocket.send(self._join([m.content for m in batch]))
+            except Exception:
+                for message in reversed(batch):
+                    self._push(message, front=True)
+                raise
+            now = time.monotonic()
+            for message in batch:
+                wait = now - message.enqueued_at
+                waits = self._waits[message.lane]
+                waits[0] += 1
+                waits[1] += wait
+                waits[2] = max(waits[2], wait)
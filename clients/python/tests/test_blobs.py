@@ -0,0 +1,72 @@
+import hashlib
+import random
+import statistics
+import tempfile
+import unittest
+from pathlib import Path
+
+from coflux import blobs
+
+
+def _chunk_sizes(data: bytes) -> list[int]:
+    sizes = []
+    while data:
+        boundary = blobs._find_boundary(data) or min(len(data), blobs._CHUNK_MAX_SIZE)
+        sizes.append(boundary)
+        data = data[boundary:]
+    return sizes
+
+
+class ChunkingTest(unittest.TestCase):
+    def test_chunk_sizes(self):
+        data = random.Random(0).randbytes(64 * 1024 * 1024)
+        sizes = _chunk_sizes(data)
+        # (the last chunk is whatever's left)
+        self.assertTrue(
+            all(
+                blobs._CHUNK_MIN_SIZE <= s <= blobs._CHUNK_MAX_SIZE for s in sizes[:-1]
+            )
+        )
+        self.assertLess(sizes.count(blobs._CHUNK_MAX_SIZE), len(sizes) // 20)
+        mean = statistics.mean(sizes[:-1])
+        self.assertGreater(mean, 0.75 * 1024 * 1024)
+        self.assertLess(mean, 1.5 * 1024 * 1024)
+
+    def test_insertion_only_affects_nearby_chunks(self):
+        data = random.Random(1).randbytes(16 * 1024 * 1024)
+        middle = len(data) // 2
+        sizes = _chunk_sizes(data)
+        changed = _chunk_sizes(data[:middle] + b"inserted" + data[middle:])
+        self.assertGreater(len(set(sizes) & set(changed)), len(sizes) - 3)
+
+
+class RestoreTest(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.directory = Path(temp_dir.name)
+        self.manager = blobs.Manager([], "localhost", str(self.directory / "cache"))
+        self.content = b"hello"
+        self.key = hashlib.sha256(self.content).hexdigest()
+        self.cached = self.manager._cached(self.key, self.content)
+
+    def test_restore_after_linked_restore(self):
+        path = self.directory / "file.txt"
+        self.manager.restore(self.key, path, link=True)
+        self.manager.restore(self.key, path)
+        self.assertFalse(path.samefile(self.cached))
+        self.assertEqual(path.read_bytes(), self.content)
+        self.assertEqual(self.cached.read_bytes(), self.content)
+        path.write_bytes(b"modified")
+        self.assertEqual(self.cached.read_bytes(), self.content)
+
+    def test_restore_replaces_existing_file(self):
+        path = self.directory / "file.txt"
+        path.write_bytes(b"existing content")
+        self.manager.restore(self.key, path, link=True)
+        self.assertEqual(path.read_bytes(), self.content)
+        self.assertEqual(self.cached.read_bytes(), self.content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,7 @@
 defmodule Coflux.Handlers.Agent do
   import Coflux.Handlers.Utils
 
-  alias Coflux.{Orchestration, Projects}
+  alias Coflux.{MessagePack, Orchestration, Projects}
 
   def init(req, _opts) do
     qs = :cowboy_req.parse_qs(req)
@@ -12,24 +12,33 @@ defmodule Coflux.Handlers.Agent do
     agent_id = get_query_param(qs, "launch", &String.to_integer/1)
     provides = get_query_param(qs, "provides", &parse_provides/1)
     concurrency = get_query_param(qs, "concurrency", &String.to_integer/1) || 0
+    format = get_query_param(qs, "format", &parse_format/1) || :json
 
+    # (compression is used if the agent requests it)
     {:cowboy_websocket, req,
-     {project_id, session_id, environment_name, agent_id, provides, concurrency}}
+     {project_id, session_id, environment_name, agent_id, provides, concurrency, format},
+     %{compress: true}}
   end
 
-  def websocket_init({project_id, session_id, environment_name, agent_id, provides, concurrency}) do
+  def websocket_init(
+        {project_id, session_id, environment_name, agent_id, provides, concurrency, format}
+      ) do
     case Projects.get_project_by_id(Coflux.ProjectsServer, project_id) do
       {:ok, _} ->
         # TODO: authenticate
         # TODO: monitor server?
         case connect(project_id, session_id, environment_name, agent_id, provides, concurrency) do
           {:ok, session_id, execution_ids} ->
-            {[session_message(session_id)],
-             %{
-               project_id: project_id,
-               session_id: session_id,
-               execution_ids: execution_ids
-             }}
+            encode_messages(
+              {[session_message(session_id)],
+               %{
+                 project_id: project_id,
+                 session_id: session_id,
+                 execution_ids: execution_ids,
+                 format: format
+               }},
+              format
+            )
 
           {:error, :environment_invalid} ->
             {[{:close, 4000, "environment_not_found"}], nil}
@@ -47,8 +56,66 @@ defmodule Coflux.Handlers.Agent do
   end
 
   def websocket_handle({:text, text}, state) do
-    message = Jason.decode!(text)
+    text
+    |> Jason.decode!()
+    |> handle_messages(state)
+    |> encode_messages(state.format)
+  end
+
+  def websocket_handle({:binary, data}, state) do
+    data
+    |> MessagePack.unpack!(&unpack_ext/2)
+    |> handle_messages(state)
+    |> encode_messages(state.format)
+  end
+
+  def websocket_handle(_data, state) do
+    {[], state}
+  end
+
+  def websocket_info({:execute, execution_id, repository, target, arguments}, state) do
+    arguments = Enum.map(arguments, &compose_value/1)
+    state = Map.update!(state, :execution_ids, &MapSet.put(&1, execution_id))
+
+    encode_messages(
+      {[command_message("execute", [execution_id, repository, target, arguments])], state},
+      state.format
+    )
+  end
+
+  def websocket_info({:result, request_id, result}, state) do
+    encode_messages(
+      {[success_message(request_id, compose_result(result))], state},
+      state.format
+    )
+  end
+
+  def websocket_info({:abort, execution_id}, state) do
+    encode_messages({[command_message("abort", [execution_id])], state}, state.format)
+  end
+
+  def websocket_info(:stop, state) do
+    {[{:close, 4000, "environment_not_found"}], state}
+  end
 
+  # (the agent may send a batch of messages in a single frame)
+  defp handle_messages(messages, state) when is_list(messages) do
+    {frames, state} =
+      Enum.reduce_while(messages, {[], state}, fn message, {frames, state} ->
+        {message_frames, state} = handle_message(message, state)
+        frames = [message_frames | frames]
+        # (stop if the connection is being closed)
+        if state, do: {:cont, {frames, state}}, else: {:halt, {frames, state}}
+      end)
+
+    {frames |> Enum.reverse() |> Enum.concat(), state}
+  end
+
+  defp handle_messages(message, state) do
+    handle_message(message, state)
+  end
+
+  defp handle_message(message, state) do
     case message["request"] do
       "declare_targets" ->
         [targets] = message["params"]
@@ -263,10 +330,12 @@ defmodule Coflux.Handlers.Agent do
           case Orchestration.get_asset(
                  state.project_id,
                  asset_id,
-                 from_execution_id: from_execution_id
+                 from_execution_id: from_execution_id,
+                 load_metadata: true
                ) do
-            {:ok, asset_type, path, blob_key, _metadata} ->
-              {[success_message(message["id"], [asset_type, path, blob_key])], state}
+            {:ok, asset_type, path, blob_key, metadata} ->
+              {[success_message(message["id"], [asset_type, path, blob_key, metadata])],
+               state}
 
             {:error, error} ->
               {[error_message(message["id"], error)], state}
@@ -302,28 +371,6 @@ defmodule Coflux.Handlers.Agent do
     end
   end
 
-  def websocket_handle(_data, state) do
-    {[], state}
-  end
-
-  def websocket_info({:execute, execution_id, repository, target, arguments}, state) do
-    arguments = Enum.map(arguments, &compose_value/1)
-    state = Map.update!(state, :execution_ids, &MapSet.put(&1, execution_id))
-    {[command_message("execute", [execution_id, repository, target, arguments])], state}
-  end
-
-  def websocket_info({:result, request_id, result}, state) do
-    {[success_message(request_id, compose_result(result))], state}
-  end
-
-  def websocket_info({:abort, execution_id}, state) do
-    {[command_message("abort", [execution_id])], state}
-  end
-
-  def websocket_info(:stop, state) do
-    {[{:close, 4000, "environment_not_found"}], state}
-  end
-
   defp connect(project_id, session_id, environment_name, agent_id, provides, concurrency) do
     if session_id do
       with {:ok, execution_ids} <- Orchestration.resume_session(project_id, session_id, self()) do
@@ -349,19 +396,54 @@ defmodule Coflux.Handlers.Agent do
   end
 
   defp session_message(session_id) do
-    {:text, Jason.encode!([0, session_id])}
+    {:message, [0, session_id]}
   end
 
   defp command_message(command, params) do
-    {:text, Jason.encode!([1, %{"command" => command, "params" => params}])}
+    {:message, [1, %{"command" => command, "params" => params}]}
   end
 
   defp success_message(id, result) do
-    {:text, Jason.encode!([2, id, result])}
+    {:message, [2, id, result]}
   end
 
   defp error_message(id, error) do
-    {:text, Jason.encode!([3, id, error])}
+    {:message, [3, id, error]}
+  end
+
+  defp encode_messages({frames, state}, format) do
+    {Enum.map(frames, &encode_frame(&1, format)), state}
+  end
+
+  defp encode_frame({:message, message}, :msgpack) do
+    case MessagePack.pack(message) do
+      {:ok, data} ->
+        {:binary, data}
+
+      {:error, _} ->
+        # (e.g., integers that don't fit in 64 bits)
+        encode_frame({:message, message}, :json)
+    end
+  end
+
+  defp encode_frame({:message, message}, :json) do
+    {:text, Jason.encode!(message)}
+  end
+
+  defp encode_frame(frame, _format) do
+    frame
+  end
+
+  # (MessagePack) extension type for data that the agent has already encoded as JSON
+  defp unpack_ext(1, data) do
+    Jason.decode!(data)
+  end
+
+  defp parse_format(value) do
+    case value do
+      "msgpack" -> :msgpack
+      _other -> :json
+    end
   end
 
   defp parse_type(type) do
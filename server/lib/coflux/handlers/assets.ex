@@ -27,7 +27,7 @@ defmodule Coflux.Handlers.Assets do
               file_asset(blob_key, metadata, req)
 
             asset_type == 1 ->
-              directory_asset(blob_key, path, req)
+              directory_asset(blob_key, metadata, path, req)
 
             true ->
               not_found(req)
@@ -52,8 +52,32 @@ defmodule Coflux.Handlers.Assets do
     end
   end
 
-  defp directory_asset(blob_key, path, req) do
-    case load_zip(blob_key) do
+  defp directory_asset(blob_key, %{"format" => "files"}, path, req) do
+    case load_manifest(blob_key) do
+      {:ok, files} ->
+        path = Enum.join(path, "/")
+
+        cond do
+          path == "" ->
+            files
+            |> Map.new(fn {path, [_blob_key, size, _mode]} -> {path, size} end)
+            |> directory_index(req)
+
+          Map.has_key?(files, path) ->
+            [file_key, _size, _mode] = Map.fetch!(files, path)
+            manifest_file(file_key, path, req)
+
+          true ->
+            not_found(req)
+        end
+
+      {:error, :not_found} ->
+        not_found(req)
+    end
+  end
+
+  defp directory_asset(blob_key, metadata, path, req) do
+    case load_zip(blob_key, metadata) do
       {:ok, unzip, paths} ->
         path = Enum.join(path, "/")
 
@@ -73,18 +97,64 @@ defmodule Coflux.Handlers.Assets do
     end
   end
 
-  defp load_zip(blob_key) do
+  defp load_manifest(blob_key) do
     path = blob_path(blob_key)
 
     if File.exists?(path) do
-      {:ok, unzip} = path |> Unzip.LocalFile.open() |> Unzip.new()
+      %{"files" => files} = path |> File.read!() |> Jason.decode!()
+      {:ok, files}
+    else
+      {:error, :not_found}
+    end
+  end
+
+  defp load_zip(blob_key, metadata) do
+    case zip_path(blob_key, metadata) do
+      {:ok, path} ->
+        {:ok, unzip} = path |> Unzip.LocalFile.open() |> Unzip.new()
+
+        paths =
+          unzip
+          |> Unzip.list_entries()
+          |> Map.new(&{&1.file_name, &1.uncompressed_size})
 
-      paths =
-        unzip
-        |> Unzip.list_entries()
-        |> Map.new(&{&1.file_name, &1.uncompressed_size})
+        {:ok, unzip, paths}
 
-      {:ok, unzip, paths}
+      {:error, :not_found} ->
+        {:error, :not_found}
+    end
+  end
+
+  defp zip_path(blob_key, %{"chunked" => true}) do
+    path = blob_path(blob_key)
+
+    if File.exists?(path) do
+      %{"chunks" => chunks} = path |> File.read!() |> Jason.decode!()
+      chunk_paths = Enum.map(chunks, fn [chunk_key, _size] -> blob_path(chunk_key) end)
+
+      if Enum.all?(chunk_paths, &File.exists?/1) do
+        {:ok, temp_path} = Briefly.create()
+
+        File.open!(temp_path, [:write], fn file ->
+          Enum.each(chunk_paths, fn chunk_path ->
+            {:ok, _} = :file.copy(chunk_path, file)
+          end)
+        end)
+
+        {:ok, temp_path}
+      else
+        {:error, :not_found}
+      end
+    else
+      {:error, :not_found}
+    end
+  end
+
+  defp zip_path(blob_key, _metadata) do
+    path = blob_path(blob_key)
+
+    if File.exists?(path) do
+      {:ok, path}
     else
       {:error, :not_found}
     end
@@ -109,6 +179,18 @@ defmodule Coflux.Handlers.Assets do
     stream_response(req, %{"content-type" => mime_type}, stream)
   end
 
+  defp manifest_file(blob_key, path, req) do
+    blob_path = blob_path(blob_key)
+
+    if File.exists?(blob_path) do
+      mime_type = MIME.from_path(path) || @default_mime_type
+      stream = File.stream!(blob_path, 2048)
+      stream_response(req, %{"content-type" => mime_type}, stream)
+    else
+      not_found(req)
+    end
+  end
+
   defp stream_response(req, headers, stream) do
     req = :cowboy_req.stream_reply(200, headers, req)
 
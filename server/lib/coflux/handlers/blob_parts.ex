@@ -0,0 +1,148 @@
+defmodule Coflux.Handlers.BlobParts do
+  import Coflux.Handlers.Utils
+
+  alias Coflux.Utils
+  alias Coflux.Handlers.Blobs
+
+  def init(req, opts) do
+    bindings = :cowboy_req.bindings(req)
+    req = set_cors_headers(req)
+
+    # (the key is used in paths, so must be validated)
+    if Blobs.valid_key?(bindings[:key]) do
+      handle(req, :cowboy_req.method(req), bindings[:key], bindings[:index], opts)
+    else
+      {:ok, json_error_response(req, "invalid_key"), opts}
+    end
+  end
+
+  defp handle(req, "GET", key, nil, opts) do
+    dir = parts_dir(key)
+
+    parts =
+      case File.ls(dir) do
+        {:ok, names} ->
+          names
+          |> Enum.filter(&Regex.match?(~r/^\d+$/, &1))
+          |> Map.new(&{&1, File.stat!(Path.join(dir, &1)).size})
+
+        {:error, :enoent} ->
+          %{}
+      end
+
+    req = json_response(req, %{"parts" => parts})
+    {:ok, req, opts}
+  end
+
+  defp handle(req, "PUT", key, index, opts) when not is_nil(index) do
+    req =
+      case Integer.parse(index) do
+        {index, ""} when index >= 0 ->
+          {:ok, temp_path} = Briefly.create()
+          {:ok, req} = File.open!(temp_path, [:write], &read_body(req, &1))
+          dir = parts_dir(key)
+          File.mkdir_p!(dir)
+          :ok = Blobs.move_file(temp_path, Path.join(dir, Integer.to_string(index)))
+          :cowboy_req.reply(204, req)
+
+        _other ->
+          json_error_response(req, "invalid_index")
+      end
+
+    {:ok, req, opts}
+  end
+
+  defp handle(req, "POST", key, nil, opts) do
+    {:ok, arguments, errors, req} =
+      read_arguments(req, %{count: {"count", &parse_count/1}})
+
+    req =
+      if Enum.empty?(errors) do
+        # completions of the same upload are handled one at a time, so that a retried
+        # request (e.g., after the client timed out) waits for the original to finish,
+        # and then finds that the blob exists
+        :global.trans(
+          {{__MODULE__, key}, self()},
+          fn ->
+            if File.exists?(Blobs.blob_path(key)) do
+              File.rm_rf!(parts_dir(key))
+              :cowboy_req.reply(204, req)
+            else
+              complete_upload(req, key, arguments.count)
+            end
+          end,
+          [node()],
+          :infinity
+        )
+      else
+        json_error_response(req, "bad_request", details: errors)
+      end
+
+    {:ok, req, opts}
+  end
+
+  defp complete_upload(req, key, count) do
+    dir = parts_dir(key)
+    part_paths = Enum.map(0..(count - 1), &Path.join(dir, Integer.to_string(&1)))
+
+    missing =
+      part_paths
+      |> Enum.with_index()
+      |> Enum.reject(fn {part_path, _index} -> File.exists?(part_path) end)
+      |> Enum.map(fn {_part_path, index} -> index end)
+
+    if Enum.empty?(missing) do
+      {:ok, temp_path} = Briefly.create()
+
+      hash =
+        File.open!(temp_path, [:write], fn file ->
+          Enum.reduce(part_paths, :crypto.hash_init(:sha256), fn part_path, hash ->
+            part_path
+            |> File.stream!(65536)
+            |> Enum.reduce(hash, fn data, hash ->
+              :ok = IO.binwrite(file, data)
+              :crypto.hash_update(hash, data)
+            end)
+          end)
+        end)
+
+      File.rm_rf!(dir)
+
+      if key == Base.encode16(:crypto.hash_final(hash), case: :lower) do
+        path = Blobs.blob_path(key)
+        path |> Path.dirname() |> File.mkdir_p!()
+        :ok = Blobs.move_file(temp_path, path)
+        :cowboy_req.reply(204, req)
+      else
+        json_error_response(req, "hash_mismatch")
+      end
+    else
+      json_error_response(req, "missing_parts", details: %{"indexes" => missing})
+    end
+  end
+
+  defp parse_count(value) do
+    if is_integer(value) && value > 0 do
+      {:ok, value}
+    else
+      {:error, :invalid}
+    end
+  end
+
+  defp parts_dir(key) do
+    Utils.data_path("uploads/#{key}")
+  end
+
+  defp read_body(req, file) do
+    case :cowboy_req.read_body(req) do
+      {status, data, req} when status in [:ok, :more] ->
+        case IO.binwrite(file, data) do
+          :ok ->
+            case status do
+              :ok -> {:ok, req}
+              :more -> read_body(req, file)
+            end
+        end
+    end
+  end
+end
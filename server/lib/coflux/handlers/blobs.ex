@@ -19,15 +19,15 @@ defmodule Coflux.Handlers.Blobs do
   end
 
   defp handle(req, "GET", key, opts) do
-    case File.read(blob_path(key)) do
-      {:ok, content} ->
-        req = :cowboy_req.reply(200, %{}, content, req)
-        {:ok, req, opts}
+    path = blob_path(key)
 
-      {:error, :enoent} ->
-        req = :cowboy_req.reply(404, %{}, "Not found", req)
-        {:ok, req, opts}
-    end
+    req =
+      case :cowboy_req.parse_header("range", req) do
+        {:bytes, [{from, to}]} -> range_response(req, path, from, to)
+        _other -> full_response(req, path)
+      end
+
+    {:ok, req, opts}
   end
 
   defp handle(req, "PUT", key, opts) do
@@ -49,7 +49,41 @@ defmodule Coflux.Handlers.Blobs do
     end
   end
 
-  defp blob_path(<<a::binary-size(2), b::binary-size(2)>> <> c) do
+  defp full_response(req, path) do
+    case File.read(path) do
+      {:ok, content} ->
+        :cowboy_req.reply(200, %{"accept-ranges" => "bytes"}, content, req)
+
+      {:error, :enoent} ->
+        :cowboy_req.reply(404, %{}, "Not found", req)
+    end
+  end
+
+  defp range_response(req, path, from, to) do
+    case File.stat(path) do
+      {:ok, %{size: size}} ->
+        to = if to == :infinity, do: size - 1, else: min(to, size - 1)
+
+        if from <= to do
+          {:ok, file} = :file.open(path, [:read, :binary, :raw])
+          {:ok, content} = :file.pread(file, from, to - from + 1)
+          :ok = :file.close(file)
+          headers = %{"content-range" => "bytes #{from}-#{to}/#{size}"}
+          :cowboy_req.reply(206, headers, content, req)
+        else
+          :cowboy_req.reply(416, %{"content-range" => "bytes */#{size}"}, req)
+        end
+
+      {:error, :enoent} ->
+        :cowboy_req.reply(404, %{}, "Not found", req)
+    end
+  end
+
+  def valid_key?(key) do
+    is_binary(key) && Regex.match?(~r/^[0-9a-f]{64}$/, key)
+  end
+
+  def blob_path(<<a::binary-size(2), b::binary-size(2)>> <> c) do
     Utils.data_path("blobs/#{a}/#{b}/#{c}")
   end
 
@@ -70,7 +104,7 @@ defmodule Coflux.Handlers.Blobs do
     end
   end
 
-  defp move_file(source, dest) do
+  def move_file(source, dest) do
     case File.rename(source, dest) do
       :ok -> :ok
       {:error, :exdev} -> File.cp(source, dest)
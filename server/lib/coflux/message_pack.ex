@@ -0,0 +1,202 @@
+defmodule Coflux.MessagePack do
+  # Encodes/decodes the subset of MessagePack used for agent messages. Strings and
+  # binaries both decode to binaries, and binaries are encoded as strings. Extension
+  # types are decoded with the given function.
+
+  def pack(term) do
+    try do
+      {:ok, IO.iodata_to_binary(encode(term))}
+    catch
+      {:unsupported, value} -> {:error, {:unsupported, value}}
+    end
+  end
+
+  def unpack!(data, ext_fun \\ &unsupported_ext/2) do
+    case decode(data, ext_fun) do
+      {value, <<>>} -> value
+      {_value, _rest} -> raise ArgumentError, "unexpected data after MessagePack value"
+    end
+  end
+
+  defp unsupported_ext(type, _data) do
+    raise ArgumentError, "unsupported MessagePack extension type (#{type})"
+  end
+
+  defp encode(nil), do: <<0xC0>>
+  defp encode(false), do: <<0xC2>>
+  defp encode(true), do: <<0xC3>>
+  defp encode(atom) when is_atom(atom), do: encode(Atom.to_string(atom))
+
+  defp encode(int) when is_integer(int) and int >= 0 do
+    cond do
+      int < 0x80 -> <<int>>
+      int < 0x100 -> <<0xCC, int>>
+      int < 0x10000 -> <<0xCD, int::16>>
+      int < 0x100000000 -> <<0xCE, int::32>>
+      int < 0x10000000000000000 -> <<0xCF, int::64>>
+      true -> throw({:unsupported, int})
+    end
+  end
+
+  defp encode(int) when is_integer(int) do
+    cond do
+      int >= -0x20 -> <<int::8-signed>>
+      int >= -0x80 -> <<0xD0, int::8-signed>>
+      int >= -0x8000 -> <<0xD1, int::16-signed>>
+      int >= -0x80000000 -> <<0xD2, int::32-signed>>
+      int >= -0x8000000000000000 -> <<0xD3, int::64-signed>>
+      true -> throw({:unsupported, int})
+    end
+  end
+
+  defp encode(float) when is_float(float), do: <<0xCB, float::64-float>>
+
+  defp encode(binary) when is_binary(binary) do
+    size = byte_size(binary)
+
+    cond do
+      size < 0x20 -> [<<0b101::3, size::5>>, binary]
+      size < 0x100 -> [<<0xD9, size>>, binary]
+      size < 0x10000 -> [<<0xDA, size::16>>, binary]
+      size < 0x100000000 -> [<<0xDB, size::32>>, binary]
+      true -> throw({:unsupported, binary})
+    end
+  end
+
+  defp encode(list) when is_list(list) do
+    size = length(list)
+
+    header =
+      cond do
+        size < 0x10 -> <<0b1001::4, size::4>>
+        size < 0x10000 -> <<0xDC, size::16>>
+        true -> <<0xDD, size::32>>
+      end
+
+    [header | Enum.map(list, &encode/1)]
+  end
+
+  defp encode(map) when is_map(map) and not is_struct(map) do
+    size = map_size(map)
+
+    header =
+      cond do
+        size < 0x10 -> <<0b1000::4, size::4>>
+        size < 0x10000 -> <<0xDE, size::16>>
+        true -> <<0xDF, size::32>>
+      end
+
+    [header | Enum.map(map, fn {key, value} -> [encode(key), encode(value)] end)]
+  end
+
+  defp encode(value), do: throw({:unsupported, value})
+
+  defp decode(<<0xC0, rest::binary>>, _ext_fun), do: {nil, rest}
+  defp decode(<<0xC2, rest::binary>>, _ext_fun), do: {false, rest}
+  defp decode(<<0xC3, rest::binary>>, _ext_fun), do: {true, rest}
+
+  # (positive and negative fixints)
+  defp decode(<<int::8-signed, rest::binary>>, _ext_fun) when int >= -0x20, do: {int, rest}
+
+  defp decode(<<0b1000::4, size::4, rest::binary>>, ext_fun),
+    do: decode_map(rest, size, ext_fun, [])
+
+  defp decode(<<0b1001::4, size::4, rest::binary>>, ext_fun),
+    do: decode_array(rest, size, ext_fun, [])
+
+  defp decode(<<0b101::3, size::5, value::binary-size(size), rest::binary>>, _ext_fun),
+    do: {value, rest}
+
+  defp decode(<<0xC4, size, value::binary-size(size), rest::binary>>, _ext_fun),
+    do: {value, rest}
+
+  defp decode(<<0xC5, size::16, value::binary-size(size), rest::binary>>, _ext_fun),
+    do: {value, rest}
+
+  defp decode(<<0xC6, size::32, value::binary-size(size), rest::binary>>, _ext_fun),
+    do: {value, rest}
+
+  defp decode(<<0xC7, size, type::8-signed, rest::binary>>, ext_fun),
+    do: decode_ext(rest, size, type, ext_fun)
+
+  defp decode(<<0xC8, size::16, type::8-signed, rest::binary>>, ext_fun),
+    do: decode_ext(rest, size, type, ext_fun)
+
+  defp decode(<<0xC9, size::32, type::8-signed, rest::binary>>, ext_fun),
+    do: decode_ext(rest, size, type, ext_fun)
+
+  defp decode(<<0xCA, value::32-float, rest::binary>>, _ext_fun), do: {value, rest}
+  defp decode(<<0xCB, value::64-float, rest::binary>>, _ext_fun), do: {value, rest}
+  defp decode(<<0xCC, value, rest::binary>>, _ext_fun), do: {value, rest}
+  defp decode(<<0xCD, value::16, rest::binary>>, _ext_fun), do: {value, rest}
+  defp decode(<<0xCE, value::32, rest::binary>>, _ext_fun), do: {value, rest}
+  defp decode(<<0xCF, value::64, rest::binary>>, _ext_fun), do: {value, rest}
+  defp decode(<<0xD0, value::8-signed, rest::binary>>, _ext_fun), do: {value, rest}
+  defp decode(<<0xD1, value::16-signed, rest::binary>>, _ext_fun), do: {value, rest}
+  defp decode(<<0xD2, value::32-signed, rest::binary>>, _ext_fun), do: {value, rest}
+  defp decode(<<0xD3, value::64-signed, rest::binary>>, _ext_fun), do: {value, rest}
+
+  defp decode(<<0xD4, type::8-signed, rest::binary>>, ext_fun),
+    do: decode_ext(rest, 1, type, ext_fun)
+
+  defp decode(<<0xD5, type::8-signed, rest::binary>>, ext_fun),
+    do: decode_ext(rest, 2, type, ext_fun)
+
+  defp decode(<<0xD6, type::8-signed, rest::binary>>, ext_fun),
+    do: decode_ext(rest, 4, type, ext_fun)
+
+  defp decode(<<0xD7, type::8-signed, rest::binary>>, ext_fun),
+    do: decode_ext(rest, 8, type, ext_fun)
+
+  defp decode(<<0xD8, type::8-signed, rest::binary>>, ext_fun),
+    do: decode_ext(rest, 16, type, ext_fun)
+
+  defp decode(<<0xD9, size, value::binary-size(size), rest::binary>>, _ext_fun),
+    do: {value, rest}
+
+  defp decode(<<0xDA, size::16, value::binary-size(size), rest::binary>>, _ext_fun),
+    do: {value, rest}
+
+  defp decode(<<0xDB, size::32, value::binary-size(size), rest::binary>>, _ext_fun),
+    do: {value, rest}
+
+  defp decode(<<0xDC, size::16, rest::binary>>, ext_fun),
+    do: decode_array(rest, size, ext_fun, [])
+
+  defp decode(<<0xDD, size::32, rest::binary>>, ext_fun),
+    do: decode_array(rest, size, ext_fun, [])
+
+  defp decode(<<0xDE, size::16, rest::binary>>, ext_fun),
+    do: decode_map(rest, size, ext_fun, [])
+
+  defp decode(<<0xDF, size::32, rest::binary>>, ext_fun),
+    do: decode_map(rest, size, ext_fun, [])
+
+  defp decode(_data, _ext_fun) do
+    raise ArgumentError, "invalid MessagePack data"
+  end
+
+  defp decode_array(rest, 0, _ext_fun, values) do
+    {Enum.reverse(values), rest}
+  end
+
+  defp decode_array(data, size, ext_fun, values) do
+    {value, rest} = decode(data, ext_fun)
+    decode_array(rest, size - 1, ext_fun, [value | values])
+  end
+
+  defp decode_ext(data, size, type, ext_fun) do
+    <<ext_data::binary-size(size), rest::binary>> = data
+    {ext_fun.(type, ext_data), rest}
+  end
+
+  defp decode_map(rest, 0, _ext_fun, pairs) do
+    {Map.new(pairs), rest}
+  end
+
+  defp decode_map(data, size, ext_fun, pairs) do
+    {key, rest} = decode(data, ext_fun)
+    {value, rest} = decode(rest, ext_fun)
+    decode_map(rest, size - 1, ext_fun, [{key, value} | pairs])
+  end
+end
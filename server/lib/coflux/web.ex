@@ -16,6 +16,7 @@ defmodule Coflux.Web do
       {:_,
        [
          {"/blobs/:key", Handlers.Blobs, []},
+         {"/blobs/:key/parts/[:index]", Handlers.BlobParts, []},
          {"/assets/:project/:asset/[...]", Handlers.Assets, []},
          {"/agent", Handlers.Agent, []},
          {"/topics", TopicalHandler, registry: Coflux.TopicalRegistry},
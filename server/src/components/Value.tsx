@@ -121,48 +121,12 @@ function Data({ data, references, projectId }: DataProps) {
           case "fragment":
             const primaryBlobStore = createBlobStore(blobStoresSetting[0]);
             return (
-              <Menu>
-                <MenuButton className="bg-slate-100 rounded px-1.5 py-0.5 text-xs font-sans inline-flex gap-1">
-                  {reference.format}
-                  <span className="text-slate-500">
-                    ({humanSize(reference.size)})
-                  </span>
-                  <IconChevronDown
-                    size={16}
-                    className="text-slate-600"
-                    strokeWidth={1.5}
-                  />
-                </MenuButton>
-                <MenuItems
-                  transition
-                  anchor="bottom"
-                  className="bg-white shadow-xl rounded-md origin-top transition duration-200 ease-out data-[closed]:scale-95 data-[closed]:opacity-0"
-                >
-                  <dl className="flex flex-col gap-1 p-2">
-                    {Object.entries(reference.metadata).map(([key, value]) => (
-                      <div key={key}>
-                        <dt className="text-xs text-slate-500">{key}</dt>
-                        <dd className="text-sm text-slate-900">
-                          {typeof value == "string"
-                            ? value
-                            : JSON.stringify(value)}
-                        </dd>
-                      </div>
-                    ))}
-                  </dl>
-                  <MenuSeparator className="my-1 h-px bg-slate-100" />
-                  <MenuItem>
-                    <a
-                      href={primaryBlobStore.url(reference.blobKey)}
-                      download
-                      className="text-sm m-1 p-1 rounded-md data-[active]:bg-slate-100 flex items-center gap-1"
-                    >
-                      <IconDownload size={16} />
-                      Download
-                    </a>
-                  </MenuItem>
-                </MenuItems>
-              </Menu>
+              <FragmentMenu
+                format={reference.format}
+                size={reference.size}
+                metadata={reference.metadata}
+                downloadUrl={primaryBlobStore.url(reference.blobKey)}
+              />
             );
           case "execution":
             const execution = reference.execution;
@@ -190,6 +154,15 @@ function Data({ data, references, projectId }: DataProps) {
               </AssetLink>
             );
         }
+      case "inline":
+        return (
+          <FragmentMenu
+            format={data.format}
+            size={base64Size(data.content)}
+            metadata={data.metadata}
+            downloadUrl={`data:application/octet-stream;base64,${data.content}`}
+          />
+        );
     }
   } else if (typeof data == "string") {
     return (
@@ -210,6 +183,66 @@ function Data({ data, references, projectId }: DataProps) {
   }
 }
 
+function base64Size(content: string) {
+  const padding = content.endsWith("==") ? 2 : content.endsWith("=") ? 1 : 0;
+  return (content.length / 4) * 3 - padding;
+}
+
+type FragmentMenuProps = {
+  format: string;
+  size: number;
+  metadata: Record<string, any>;
+  downloadUrl: string;
+};
+
+function FragmentMenu({
+  format,
+  size,
+  metadata,
+  downloadUrl,
+}: FragmentMenuProps) {
+  return (
+    <Menu>
+      <MenuButton className="bg-slate-100 rounded px-1.5 py-0.5 text-xs font-sans inline-flex gap-1">
+        {format}
+        <span className="text-slate-500">({humanSize(size)})</span>
+        <IconChevronDown
+          size={16}
+          className="text-slate-600"
+          strokeWidth={1.5}
+        />
+      </MenuButton>
+      <MenuItems
+        transition
+        anchor="bottom"
+        className="bg-white shadow-xl rounded-md origin-top transition duration-200 ease-out data-[closed]:scale-95 data-[closed]:opacity-0"
+      >
+        <dl className="flex flex-col gap-1 p-2">
+          {Object.entries(metadata).map(([key, value]) => (
+            <div key={key}>
+              <dt className="text-xs text-slate-500">{key}</dt>
+              <dd className="text-sm text-slate-900">
+                {typeof value == "string" ? value : JSON.stringify(value)}
+              </dd>
+            </div>
+          ))}
+        </dl>
+        <MenuSeparator className="my-1 h-px bg-slate-100" />
+        <MenuItem>
+          <a
+            href={downloadUrl}
+            download
+            className="text-sm m-1 p-1 rounded-md data-[active]:bg-slate-100 flex items-center gap-1"
+          >
+            <IconDownload size={16} />
+            Download
+          </a>
+        </MenuItem>
+      </MenuItems>
+    </Menu>
+  );
+}
+
 async function loadBlob(
   blobStoresSetting: settings.BlobStoreSettings[],
   blobKey: string,
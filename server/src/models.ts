@@ -103,7 +103,13 @@ export type Data =
   | { type: "dict"; items: Data[] }
   | { type: "set"; items: Data[] }
   | { type: "tuple"; items: Data[] }
-  | { type: "ref"; index: number };
+  | { type: "ref"; index: number }
+  | {
+      type: "inline";
+      format: string;
+      content: string;
+      metadata: Record<string, any>;
+    };
 
 export type Value = (
   | {